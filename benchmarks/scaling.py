@@ -0,0 +1,197 @@
+"""
+Times each report and the main kernels on generated data (see
+snapshot.utilities.synthetic) at a range of y_log sizes, and measures the
+peak memory each allocates. Run it from a folder with a filled-in
+config.yml, e.g.
+
+    python benchmarks/scaling.py --sizes 10000 100000 1000000 --out scaling.csv
+
+The reports run with fresh in-memory sessions; the on-disk caches in the
+performance section (frame cache, episode store, results cache) are left
+off so every run does the full work. slope is the log-log slope of the
+time against the previous size (1.0 is linear).
+"""
+
+import argparse
+import gc
+import math
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import warnings
+import pandas as pd
+from snapshot.config import app_config
+from snapshot.analysis.analysis import ShelterAnalysis
+from snapshot.analysis.demographics import AgeDemographics
+from snapshot.cli.snapshot import SNAPSHOTS
+from snapshot.foundation.dataframe_builds import groupby_df_build
+import snapshot.foundation.fetch_files as ff
+import snapshot.utilities.dates as sud
+from snapshot.utilities.synthetic import write_month
+
+
+def new_session():
+    return ff.LoadSession(
+        chunksize=app_config.y_log_chunksize,
+        categoricals=app_config.categorical_columns,
+    )
+
+
+def load_network(start_dt, end_dt):
+    return new_session().get_name_df_dictionary(
+        fn_ylog=app_config.fn_ylog,
+        fn_youth=app_config.fn_youth,
+        fn_a_programs=app_config.fn_a_programs,
+        dir_=os.path.join(app_config.dev_root, sud.end_dt_to_folder(end_dt=end_dt)),
+        rp_start_dt=start_dt,
+        end_dt=end_dt,
+    )
+
+
+def merge_all_programs(df_dict, start_dt, end_dt):
+    return ShelterAnalysis(
+        df_dict=df_dict,
+        rp_start_dt=start_dt,
+        month_start_dt=sud.calc_month_start_from_end_dt(end_dt=end_dt),
+        end_dt=end_dt,
+    ).merge_floored_base_dfs(
+        intake_col=app_config.intake_dt_column,
+        exit_col=app_config.exit_dt_column,
+        ylog_youth_merge_on=app_config.youth_id_column,
+        intermed_aprogs_merge_on=app_config.program_id_column,
+        columns=app_config.demographic_columns,
+    )
+
+
+def benchmarks(start_dt, end_dt):
+    """name -> no argument callable, the kernels get their inputs built once"""
+    df_dict = load_network(start_dt, end_dt)
+    served_df = merge_all_programs(df_dict, start_dt, end_dt).merged_served_df
+
+    benches = {
+        "load_network": lambda: load_network(start_dt, end_dt),
+        "merge_floored_base_dfs": lambda: merge_all_programs(df_dict, start_dt, end_dt),
+        "groupby_df_build": lambda: groupby_df_build(
+            served_df,
+            app_config.gender_column,
+            app_config.intake_dt_column,
+            "count",
+            also_nan="nan",
+        ),
+        "AgeDemographics": lambda: AgeDemographics(
+            input_df=served_df,
+            birthdt_col_name=app_config.birth_dt_column,
+            reference_col_name=app_config.intake_dt_column,
+            agg_on=app_config.intake_dt_column,
+            bins=app_config.shelter_age_bins,
+        ).create_ages_groupby_df(),
+    }
+    for func in SNAPSHOTS:
+        benches[func.__name__] = lambda func=func: func(
+            start_dt, end_dt, False, session=new_session()
+        )
+    return benches, len(served_df)
+
+
+def measure(func, repeat):
+    """best wall time of repeat runs, then the peak traced memory of one more"""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak / 1024**2
+
+
+def add_slopes(results):
+    results = results.sort_values(["benchmark", "episodes"]).reset_index(drop=True)
+    slopes = []
+    for i, row in results.iterrows():
+        prev = results.iloc[i - 1] if i > 0 else None
+        if prev is None or prev["benchmark"] != row["benchmark"]:
+            slopes.append(float("nan"))
+            continue
+        slopes.append(
+            math.log(max(row["seconds"], 1e-9) / max(prev["seconds"], 1e-9))
+            / math.log(row["episodes"] / prev["episodes"])
+        )
+    results["slope"] = [round(s, 2) for s in slopes]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Use to time the reports and kernels across data sizes"
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--start-date", type=pd.Timestamp, default="2019-07-01")
+    parser.add_argument("--end-date", type=pd.Timestamp, default="2019-12-31")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--root",
+        default=None,
+        help="where to write the generated data, kept and reused between runs "
+        "(default: a temporary folder removed afterwards)",
+    )
+    parser.add_argument("--only", nargs="+", default=None, help="benchmarks to run")
+    parser.add_argument("--out", default=None, help="csv to write the results to")
+
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    root = args.root or tempfile.mkdtemp(prefix="snapshot-bench-")
+    app_config.results_cache_dir = None
+
+    rows = []
+    try:
+        for size in args.sizes:
+            size_root = os.path.join(root, str(size))
+            month_dir = os.path.join(
+                size_root, sud.end_dt_to_folder(end_dt=args.end_date)
+            )
+            if not os.path.exists(month_dir):
+                print(f"generating {size} episodes")
+                write_month(size_root, args.end_date, size)
+            app_config.dev_root = size_root
+
+            benches, served_rows = benchmarks(args.start_date, args.end_date)
+            for name, func in benches.items():
+                if args.only is not None and name not in args.only:
+                    continue
+                seconds, peak_mb = measure(func, args.repeat)
+                print(f"{size:>10} {name:<24} {seconds:9.3f}s {peak_mb:10.1f}MB")
+                rows.append(
+                    {
+                        "benchmark": name,
+                        "episodes": size,
+                        "served_rows": served_rows,
+                        "seconds": round(seconds, 4),
+                        "peak_mb": round(peak_mb, 1),
+                    }
+                )
+    finally:
+        if args.root is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    results = add_slopes(pd.DataFrame(rows))
+    print()
+    print(results.to_string(index=False))
+    if args.out is not None:
+        results.to_csv(args.out, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,10 @@ setuptools.setup(
             "tlp=snapshot.cli.tlp_snapshot:tlp_cli",
             "jac=snapshot.cli.jac_snapshot:jac_cli",
             "snapshot=snapshot.cli.snapshot:all_cli",
+            "snapshot-server=snapshot.cli.server:server_cli",
+            "snapshot-client=snapshot.cli.server:client_cli",
+            "backfill=snapshot.cli.backfill:backfill_cli",
+            "synthetic=snapshot.utilities.synthetic:synthetic_cli",
         ]
     },
     install_requires=["pandas", "openpyxl", "xlrd", "PyYaml"],
@@ -1,5 +1,7 @@
 from collections import namedtuple
+import numpy as np
 import pandas as pd
+from snapshot.foundation import episodes
 from snapshot.foundation.dataframe_builds import (
     MergeAnalysisBase,
     AnalysisBase,
@@ -7,6 +9,7 @@ from snapshot.foundation.dataframe_builds import (
 )
 from snapshot.preproccess import clean
 import snapshot.utilities.dates as sud
+import snapshot.utilities.profiling as profiling
 
 
 class ShelterAnalysis(MergeAnalysisBase):
@@ -18,15 +21,16 @@ class ShelterAnalysis(MergeAnalysisBase):
     # this makes exit_col, intake_col prog_name_col available as well
 
     def calc_num_served_month(self):
-        month_exits = self.rp_served_df[self.exit_col] >= self.month_start_dt
-        opens = self.rp_served_df[self.exit_col].isna()
-        served_month_df = self.rp_served_df.loc[month_exits | opens, :]
-        return len(served_month_df)
+        return self.episode_index.count_served(self.month_start_dt, self.end_dt)
 
     def create_month_intakes_per_program_df(self):
-        rp_intakes_df = self.rp_intakes_df.copy()
-        mo_intakes_subset = rp_intakes_df[self.intake_col] >= self.month_start_dt
-        mo_intakes_df = rp_intakes_df[mo_intakes_subset]
+        mo_intakes_in_served = self.episode_index.intake_positions(
+            self.month_start_dt, self.end_dt
+        )
+        mo_intakes_df = self._select_rows(
+            self._rp_served_rows[mo_intakes_in_served],
+            [self.prog_name_col, self.intake_col],
+        )
         count_per_prog_df = groupby_df_build(
             mo_intakes_df,
             group_on=self.prog_name_col,
@@ -36,33 +40,30 @@ class ShelterAnalysis(MergeAnalysisBase):
         return count_per_prog_df
 
     def create_caredays_per_program_df(self):
-        # create columns for calculating care days
-        intake_col = self.intake_col
-        exit_col = self.exit_col
-        end = pd.to_datetime(self.end_dt)
-        rp_start = pd.to_datetime(self.rp_start_dt)
-        care_df = self.rp_served_df.copy()
-
-        trunc_to_rp_start = care_df[intake_col] < rp_start
-        trunc_to_end = care_df[exit_col] > end
-        fill_as_end = care_df[exit_col].isna()
-
-        care_df.loc[trunc_to_rp_start, intake_col] = rp_start
-        care_df.loc[trunc_to_end | fill_as_end, exit_col] = end
-
-        care_df["care_days"] = (
-            care_df[exit_col] - care_df[intake_col] + pd.to_timedelta("1 day")
+        # stays are truncated to the report period, open cases run to the end
+        care_days = episodes.episode_care_days(
+            self.episode_index.intake_days,
+            self.episode_index.exit_days,
+            self.rp_start_dt,
+            self.end_dt,
         )
-
-        sum_per_prog_df = groupby_df_build(
+        care_df = pd.DataFrame(
+            {
+                self.prog_name_col: self.merged_served_df[self.prog_name_col].values[
+                    self._rp_served_rows
+                ],
+                "care_days": care_days,
+            }
+        )
+        return groupby_df_build(
             care_df, group_on=self.prog_name_col, agg_on="care_days", agg_func="sum"
         )
-        sum_per_prog_df["sum"] = sum_per_prog_df["sum"].dt.days
-        return sum_per_prog_df
 
     def create_rp_served_per_program_df(self):
         count_per_prog_df = groupby_df_build(
-            self.rp_served_df,
+            self._select_rows(
+                self._rp_served_rows, [self.prog_name_col, self.intake_col]
+            ),
             group_on=self.prog_name_col,
             agg_on=self.intake_col,
             agg_func="count",
@@ -70,12 +71,19 @@ class ShelterAnalysis(MergeAnalysisBase):
         return count_per_prog_df
 
     def create_avg_los_per_program_df(self):
-        rp_exits_df = self.rp_exits_df.copy()
-        rp_exits_df["length_of_stay"] = (
-            rp_exits_df[self.exit_col] - rp_exits_df[self.intake_col]
-        ).divide(pd.to_timedelta("1 day"))
+        rp_exits_df = self._select_rows(
+            self._rp_exits_rows, [self.prog_name_col, self.intake_col, self.exit_col]
+        )
+        los_df = pd.DataFrame(
+            {
+                self.prog_name_col: rp_exits_df[self.prog_name_col].values,
+                "length_of_stay": _los_days(
+                    rp_exits_df, self.intake_col, self.exit_col
+                ),
+            }
+        )
         mean_per_prog_df = groupby_df_build(
-            rp_exits_df,
+            los_df,
             group_on=self.prog_name_col,
             agg_on="length_of_stay",
             agg_func="mean",
@@ -90,23 +98,45 @@ class NonResAnalysis(MergeAnalysisBase):
 
     # rp served, intakes, and exits done in base class
 
+    @profiling.profiled("set_month_analysis_dfs")
     def set_month_analysis_dfs(self):
-        self.month_served_df = self._create_month_served_df()
-        self.month_intakes_df = self._create_month_intakes_df()
-        self.month_exits_df = self._create_month_exits_df()
+        index = self.episode_index
+        month_start_dt = self.month_start_dt
+        served_rows = self._rp_served_rows
+        self._month_served_rows = served_rows[
+            index.served_positions(month_start_dt, self.end_dt)
+        ]
+        self._month_intakes_rows = served_rows[
+            index.intake_positions(month_start_dt, self.end_dt)
+        ]
+        self._month_exits_rows = served_rows[
+            index.exit_positions(month_start_dt, self.end_dt)
+        ]
         return self
 
+    @property
+    def month_served_df(self):
+        return self._select_rows(self._month_served_rows)
+
+    @property
+    def month_intakes_df(self):
+        return self._select_rows(self._month_intakes_rows)
+
+    @property
+    def month_exits_df(self):
+        return self._select_rows(self._month_exits_rows)
+
     @property
     def num_served_month(self):
-        return len(self.month_served_df)
+        return self.episode_index.count_served(self.month_start_dt, self.end_dt)
 
     @property
     def num_intakes_month(self):
-        return len(self.month_intakes_df)
+        return self.episode_index.count_intakes(self.month_start_dt, self.end_dt)
 
     @property
     def num_exits_month(self):
-        return len(self.month_exits_df)
+        return self.episode_index.count_exits(self.month_start_dt, self.end_dt)
 
     @property
     def num_at_month_end(self):
@@ -124,30 +154,12 @@ class NonResAnalysis(MergeAnalysisBase):
         ins_per_month = round(intakes_left / months_left, 1)
         return ins_per_month, months_left
 
-    def _create_month_served_df(self):
-        df = self.rp_served_df
-        # intake constraint already considered in entire served
-        month_exit = df[self.exit_col] >= self.month_start_dt
-        month_open = df[self.exit_col].isna()
-        return df.loc[(month_exit | month_open), :].copy()
-
-    def _create_month_intakes_df(self):
-        df = self.month_served_df.copy()
-        intake_in_month = df[self.intake_col] >= self.month_start_dt
-        return df.loc[intake_in_month, :].copy()
-
-    def _create_month_exits_df(self):
-        df = self.month_served_df.copy()
-        exit_gt_mon_start = df[self.exit_col] >= self.month_start_dt
-        exit_lt_end = df[self.exit_col] <= self.end_dt
-        return df.loc[exit_gt_mon_start & exit_lt_end, :].copy()
-
     def calc_avg_los(self):
-        exit_df = self.rp_exits_df.copy()
-        exit_df["los_wks"] = (
-            exit_df[self.exit_col] - exit_df[self.intake_col]
-        ) / pd.Timedelta("7 days")
-        return round(exit_df["los_wks"].mean(), 1)
+        rp_exits_df = self._select_rows(
+            self._rp_exits_rows, [self.intake_col, self.exit_col]
+        )
+        los_days = _los_days(rp_exits_df, self.intake_col, self.exit_col)
+        return round(pd.Series(los_days / 7).mean(), 1)
 
 
 class SNAPAnalysis(MergeAnalysisBase):
@@ -167,34 +179,43 @@ class TLPAnalysis(AnalysisBase):
             prog_df, intake_col_name, exit_col_name, dob_col_name, rp_start_dt, end_dt
         )
 
+    @profiling.profiled("set_subset_dfs")
     def set_subset_dfs(self, subset_col, subset):
         """
         Call this method to set the subset based on the within program subset. 
         Then analysis can be run on them.
         """
-        served = self.rp_served_df
-        intakes = self.rp_intakes_df
-        exits = self.rp_exits_df
+        in_subset = (self.rp_served_df[subset_col] == subset).values
 
-        in_subset_served = served[subset_col] == subset
-        in_subset_intake = intakes[subset_col] == subset
-        in_subset_exit = exits[subset_col] == subset
-
-        self.subset_served_df = served.loc[in_subset_served, :].copy()
-        self.subset_intakes_df = intakes.loc[in_subset_intake, :].copy()
-        self.subset_exits_df = exits.loc[in_subset_exit, :].copy()
+        self._subset_served_rows = np.flatnonzero(in_subset)
+        self._subset_intakes_rows = self._rp_intakes_rows[
+            in_subset[self._rp_intakes_rows]
+        ]
+        self._subset_exits_rows = self._rp_exits_rows[in_subset[self._rp_exits_rows]]
         return self
 
+    @property
+    def subset_served_df(self):
+        return self.rp_served_df.iloc[self._subset_served_rows, :]
+
+    @property
+    def subset_intakes_df(self):
+        return self.rp_served_df.iloc[self._subset_intakes_rows, :]
+
+    @property
+    def subset_exits_df(self):
+        return self.rp_served_df.iloc[self._subset_exits_rows, :]
+
     def num_subset_served_rp(self):
         try:
-            return len(self.subset_served_df)
+            return len(self._subset_served_rows)
         except AttributeError:
             print("Must call .set_subset_dfs() method first")
             return
 
     def num_subset_intakes_rp(self):
         try:
-            return len(self.subset_intakes_df)
+            return len(self._subset_intakes_rows)
         except AttributeError:
             # change to warn logging
             print("Must call .set_subset_dfs() method first")
@@ -202,7 +223,7 @@ class TLPAnalysis(AnalysisBase):
 
     def num_subset_exits_rp(self):
         try:
-            return len(self.subset_exits_df)
+            return len(self._subset_exits_rows)
         except AttributeError:
             # change to warn logging
             print("Must call .set_subset_dfs() method first")
@@ -210,68 +231,52 @@ class TLPAnalysis(AnalysisBase):
 
     def count_successful_exits(self, success_col, whole=True):
         if whole:
-            df = self.rp_exits_df
+            rows = self._rp_exits_rows
         else:
             try:
-                df = self.subset_exits_df
+                rows = self._subset_exits_rows
             except AttributeError:
                 raise AttributeError(
                     "Attribute: .subset_exits_df not set. Call .set_subset_dfs() first."
                 )
-        return df[success_col].str.lower().str.startswith("s").sum()
+        exit_types = self.rp_served_df[success_col].iloc[rows]
+        return exit_types.str.lower().str.startswith("s").sum()
 
     def calculate_avg_stay(self, short_stay, whole=True):
-        short_stay_timedelta = pd.Timedelta(short_stay)
+        short_stay_days = pd.Timedelta(short_stay) / pd.Timedelta("1 day")
         if whole:
-            df = self.rp_exits_df.copy()
+            rows = self._rp_exits_rows
         else:
-            df = self.subset_exits_df.copy()
-        if df.empty:
+            rows = self._subset_exits_rows
+        if len(rows) == 0:
             return pd.Timedelta("0 days")
 
-        df["_los"] = df[self.exit_col_name] - df[self.intake_col_name]
-        df["_short_stay"] = df["_los"] <= short_stay_timedelta
-        return (df.loc[~df["_short_stay"], "_los"]).mean()
+        los_days = episodes.length_of_stay(
+            self.episode_index.intake_days[rows], self.episode_index.exit_days[rows]
+        )
+        not_short_stay = los_days > short_stay_days
+        return pd.to_timedelta(los_days[not_short_stay], unit="D").mean()
 
     def calculate_utilization(self, factor, whole=True):
-        exit_col = self.exit_col_name
-        intake_col = self.intake_col_name
-        num_days = self.end_dt - self.rp_start_dt + pd.Timedelta("1 day")
+        num_days = (self.end_dt - self.rp_start_dt + pd.Timedelta("1 day")) / (
+            pd.Timedelta("1 day")
+        )
         avail = factor * num_days
-        if whole:
-            df = self.rp_served_df
-            capped_df = clean.cap_dates(
-                df=df,
-                intake_col=intake_col,
-                exit_col=exit_col,
-                start_dt=self.rp_start_dt,
-                end_dt=self.end_dt,
-            )
-            capped_df["util"] = (
-                capped_df[exit_col] - capped_df[intake_col] + pd.Timedelta("1 day")
-            )
-            actual = capped_df["util"].sum()
-            return round(actual / avail * 100, 2)
-
-        try:
-            df = self.subset_served_df
-        except AttributeError:
-            raise AttributeError(
-                "Attribute: .subset_served_df not set. Call .set_subset_dfs() first."
-            )
-        else:
-            capped_df = clean.cap_dates(
-                df=df,
-                intake_col=intake_col,
-                exit_col=exit_col,
-                start_dt=self.rp_start_dt,
-                end_dt=self.end_dt,
-            )
-            capped_df["util"] = (
-                capped_df[exit_col] - capped_df[intake_col] + pd.Timedelta("1 day")
-            )
-            actual = capped_df["util"].sum()
-            return round(actual / avail * 100, 2)
+        intake_days = self.episode_index.intake_days
+        exit_days = self.episode_index.exit_days
+        if not whole:
+            try:
+                rows = self._subset_served_rows
+            except AttributeError:
+                raise AttributeError(
+                    "Attribute: .subset_served_df not set. Call .set_subset_dfs() first."
+                )
+            intake_days, exit_days = intake_days[rows], exit_days[rows]
+        # stays are capped to the report period, open cases run to the end
+        actual = episodes.care_days(
+            intake_days, exit_days, self.rp_start_dt, self.end_dt
+        )
+        return round(actual / avail * 100, 2)
 
     def calculate_num_month_end(self, whole=True):
         """
@@ -283,6 +288,13 @@ class TLPAnalysis(AnalysisBase):
         return self.num_subset_served_rp() - self.num_subset_exits_rp()
 
 
+def _los_days(df, intake_col, exit_col):
+    """days from intake to exit for each row of df"""
+    return episodes.length_of_stay(
+        episodes.day_ordinals(df[intake_col]), episodes.day_ordinals(df[exit_col])
+    )
+
+
 class JACAnalysis:
     def __init__(
         self,
@@ -299,71 +311,106 @@ class JACAnalysis:
         self.county_contract_start_dt = county_contract_start_dt
         self.month_start_dt = sud.calc_month_start_from_end_dt(self.end_dt)
 
+    @profiling.profiled("set_analysis_dfs")
     def set_analysis_dfs(self):
-        self.rp_served_df = self._create_served_df(_start_dt=self.rp_start_dt)
-        self.month_served_df = self._create_served_df(_start_dt=self.month_start_dt)
+        # flooring copies so the input frame is left untouched
+        self._floor_df = clean.floor_dt_columns(self.prog_df, self.served_dt_col_name)
+        self._rp_served_rows = self._served_rows(_start_dt=self.rp_start_dt)
+        self._month_served_rows = self._served_rows(_start_dt=self.month_start_dt)
+        profiling.set_rows(len(self._rp_served_rows))
         return self
 
+    @profiling.profiled("set_subset_dfs")
     def set_subset_dfs(self, id_col):
         """In JAC, there exists no distinction btwn served/intakes/exits"""
         try:
-            served_rp = self.rp_served_df
-            served_month = self.month_served_df
+            served_rp = self._rp_served_rows
+            served_month = self._month_served_rows
         except AttributeError:
             raise AttributeError("Must call .set_analysis_dfs() method first")
 
         # probably safe to hardcode the cc part of it
-        is_cc_rp = served_rp[id_col].str.lower().str.endswith("cc")
-        is_cc_month = served_month[id_col].str.lower().str.endswith("cc")
-
-        self.rp_cc_served_df = served_rp.loc[is_cc_rp, :].copy()
-        self.rp_ntr_served_df = served_rp.loc[~is_cc_rp, :].copy()
-
-        self.month_cc_served_df = served_month.loc[is_cc_month, :].copy()
-        self.month_ntr_served_df = served_month.loc[~is_cc_month, :].copy()
+        ids = self._floor_df[id_col]
+        is_cc_rp = ids.iloc[served_rp].str.lower().str.endswith("cc").values
+        is_cc_month = ids.iloc[served_month].str.lower().str.endswith("cc").values
 
-        self._served_data_dict = {
+        self._is_cc_dict = {"rp": is_cc_rp, "month": is_cc_month}
+        self._served_rows_dict = {
             "rp": {
-                "all": self.rp_served_df,
-                "cc": self.rp_cc_served_df,
-                "ntr": self.rp_ntr_served_df,
+                "all": served_rp,
+                "cc": served_rp[is_cc_rp],
+                "ntr": served_rp[~is_cc_rp],
             },
             "month": {
-                "all": self.month_served_df,
-                "cc": self.month_cc_served_df,
-                "ntr": self.month_ntr_served_df,
+                "all": served_month,
+                "cc": served_month[is_cc_month],
+                "ntr": served_month[~is_cc_month],
             },
         }
         return self
 
+    def served_df(self, period, subset="all"):
+        """materializes the served rows for a period ('rp'/'month') and subset"""
+        if subset == "all":
+            rows = self._rp_served_rows if period == "rp" else self._month_served_rows
+        else:
+            rows = self._served_rows_dict[period][subset]
+        return self._floor_df.iloc[rows, :]
+
+    @property
+    def rp_served_df(self):
+        return self.served_df("rp")
+
+    @property
+    def month_served_df(self):
+        return self.served_df("month")
+
+    @property
+    def rp_cc_served_df(self):
+        return self.served_df("rp", "cc")
+
+    @property
+    def rp_ntr_served_df(self):
+        return self.served_df("rp", "ntr")
+
+    @property
+    def month_cc_served_df(self):
+        return self.served_df("month", "cc")
+
+    @property
+    def month_ntr_served_df(self):
+        return self.served_df("month", "ntr")
+
+    def labeled_served_df(self, period, label_col):
+        """served rows for a period with label_col marking each 'cc' or 'ntr'"""
+        df = self.served_df(period)
+        labels = np.where(self._is_cc_dict[period], "cc", "ntr")
+        return df.assign(**{label_col: labels})
+
     def return_num_served(self, period, subset):
         """
             subset can be 'cc', 'ntr', or 'all'
             period can be 'rp' or 'month'
         """
-        return len(self._served_data_dict[period][subset])
+        return len(self._served_rows_dict[period][subset])
 
     def groupby_referral_source(self, period, subset, group_on, agg_on):
-        input_df = self._served_data_dict[period][subset]
+        rows = self._served_rows_dict[period][subset]
+        df = self._floor_df
+        input_df = df.iloc[rows, df.columns.get_indexer([group_on, agg_on])]
         ref_source_df = groupby_df_build(
             _df=input_df, group_on=group_on, agg_on=agg_on, agg_func="count"
         )
         return ref_source_df
 
-    def _create_served_df(self, _start_dt):
-        df = self.prog_df.copy()
-        served_dt_col = self.served_dt_col_name
-
-        floor_df = clean.floor_dt_columns(df, served_dt_col)
+    def _served_rows(self, _start_dt):
+        served_dt = self._floor_df[self.served_dt_col_name]
 
-        intake_constraint = floor_df[served_dt_col] <= self.end_dt
-        exit_constraint = floor_df[served_dt_col] >= _start_dt
+        intake_constraint = served_dt <= self.end_dt
+        exit_constraint = served_dt >= _start_dt
         # there will be no nans to take into consideration
 
-        return_df = floor_df.loc[
-            (intake_constraint) & (exit_constraint), :
-        ].reset_index(drop=True)
-        return return_df
+        return np.flatnonzero(((intake_constraint) & (exit_constraint)).values)
 
 
 if __name__ == "__main__":
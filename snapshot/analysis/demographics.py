@@ -1,8 +1,56 @@
+from functools import lru_cache
 from typing import List, Tuple, Dict
+import numpy as np
 import pandas as pd
 from snapshot.config import app_config
 from snapshot.preproccess import clean
-from snapshot.foundation.dataframe_builds import groupby_df_build
+from snapshot.foundation import episodes
+from snapshot.foundation.dataframe_builds import (
+    groupby_df_build,
+    subset_groupby_df_build,
+)
+import snapshot.utilities.profiling as profiling
+
+
+class AgeBins:
+    """
+    Age bins compiled once from (low, high) tuples, the half open [low, high)
+    intervals pd.cut would use. Ages are put in a bin with a searchsorted of
+    the low edges; the "[low, high)" labels are only for display.
+    """
+
+    def __init__(self, bins: List[Tuple[int, int]]) -> None:
+        intervals = pd.IntervalIndex.from_tuples(list(bins), closed="left")
+        if intervals.is_overlapping:
+            raise ValueError("Overlapping IntervalIndex is not accepted.")
+        order = np.argsort(intervals.left.values, kind="stable")
+        self.lows = intervals.left.values[order].astype(np.float64)
+        self.highs = intervals.right.values[order].astype(np.float64)
+        self.labels = pd.Index([str(i) for i in intervals[order]], dtype=object)
+
+    def codes(self, ages) -> np.ndarray:
+        """the position in labels of each age's bin, -1 for nan or no bin"""
+        ages = np.asarray(ages, dtype=np.float64)
+        if not len(self.lows):
+            return np.full(len(ages), -1, dtype=np.int64)
+        codes = np.searchsorted(self.lows, ages, side="right") - 1
+        # past the high edge (in a gap or beyond the last bin) or nan
+        outside = (codes < 0) | ~(ages < self.highs[np.maximum(codes, 0)])
+        codes[outside] = -1
+        return codes
+
+    def categories(self, ages) -> pd.Categorical:
+        return pd.Categorical.from_codes(self.codes(ages), categories=self.labels)
+
+
+@lru_cache(maxsize=None)
+def _compiled_age_bins(bins):
+    return AgeBins(bins)
+
+
+def compile_age_bins(bins: List[Tuple[int, int]]) -> AgeBins:
+    """the AgeBins of a configured *_age_bins list, compiled on first use"""
+    return _compiled_age_bins(tuple(tuple(b) for b in bins))
 
 
 class Demographics:
@@ -23,36 +71,39 @@ class AgeDemographics(Demographics):
         self.birthdt_col_name = birthdt_col_name
         self.reference_col_name = reference_col_name
         self.bins = bins
+        self._ages = None
         super().__init__(input_df, agg_on)
 
-    def _create_age_df(self):
-        if self.input_df.empty:
-            return pd.DataFrame(
-                {},
-                columns=[self.birthdt_col_name, self.reference_col_name, self.agg_on],
+    @property
+    def ages(self):
+        """whole years at the reference date per row, worked out once"""
+        if self._ages is None:
+            self._ages = episodes.whole_years(
+                self.input_df[self.birthdt_col_name],
+                self.input_df[self.reference_col_name],
             )
-        df = self.input_df.copy()
-        df["age"] = (
-            df[self.reference_col_name] - df[self.birthdt_col_name]
-        ) / pd.to_timedelta("365 days")
-        return df
-
-    def _create_age_bin_df(self, pre_calc_age_column=None) -> pd.DataFrame:
+        return self._ages
+
+    def _create_age_bin_df(self, pre_calc_age_column=None, keep=()) -> pd.DataFrame:
+        """
+        agg_on (and the keep columns) with each row's age and age_category,
+        the label of its bin as a categorical (nan when in no bin)
+        """
+        columns = list(dict.fromkeys([*keep, self.agg_on]))
+        if self.input_df.empty:
+            return pd.DataFrame({}, columns=columns + ["age", "age_category"])
         if pre_calc_age_column is None:
-            age_df = self._create_age_df()
+            ages = self.ages
         else:
-            age_df = self.input_df.copy()
-            # the bin part expects the name to be "age"
-            age_df = age_df.rename(columns={pre_calc_age_column: "age"})
-        if age_df.empty:
-            return pd.DataFrame({}, columns=list(age_df.columns) + ["age_category"])
-        bin_intervals = pd.IntervalIndex.from_tuples(self.bins, closed="left")
-        category_series = pd.cut(age_df["age"], bins=bin_intervals)
-        df_copy = age_df.copy()
-        df_copy["age_category"] = category_series.astype(str)
-        return df_copy
+            ages = self.input_df[pre_calc_age_column].values
+        age_bin_df = pd.DataFrame({col: self.input_df[col].values for col in columns})
+        age_bin_df["age"] = ages
+        age_bin_df["age_category"] = compile_age_bins(self.bins).categories(ages)
+        return age_bin_df
 
+    @profiling.profiled("age demographics")
     def create_ages_groupby_df(self, pre_calc_age_column=None):
+        profiling.set_rows(len(self.input_df))
         age_bin_df = self._create_age_bin_df(pre_calc_age_column=pre_calc_age_column)
         self.age_bin_df = age_bin_df
         if age_bin_df.empty:
@@ -70,7 +121,9 @@ class GenderDemographics(Demographics):
     def _clean_gender_column(self):
         return clean.clean_gender_column(self.input_df, self.group_on)
 
+    @profiling.profiled("gender demographics")
     def create_genders_groupby_df(self):
+        profiling.set_rows(len(self.input_df))
         if self.input_df.empty:
             return pd.DataFrame({}, columns=["count", "percent"])
         cleaned_df = self._clean_gender_column()
@@ -84,6 +137,7 @@ class RaceDemographics(Demographics):
         self.group_on = group_on
         super().__init__(input_df, agg_on)
 
+    @profiling.profiled("race demographics")
     def create_races_groupby_df(
         self,
         race_col,
@@ -92,11 +146,13 @@ class RaceDemographics(Demographics):
         also_nan="nan",
         lowercase_first=False,
     ):
+        profiling.set_rows(len(self.input_df))
         if ethnic_col is None:
+            races_df = self.input_df
             if lowercase_first:  # useful for JAC and TLP (human entered entries)
-                self.input_df[race_col] = self.input_df[race_col].str.lower()
+                races_df = races_df.assign(**{race_col: races_df[race_col].str.lower()})
             return groupby_df_build(
-                self.input_df,
+                races_df,
                 self.group_on,
                 self.agg_on,
                 "count",
@@ -114,5 +170,68 @@ class RaceDemographics(Demographics):
         return gby_df
 
 
+class SubsetDemographics(Demographics):
+    """
+    Age, gender, and race breakdowns for every subset at once. input_df holds
+    all of the rows with subset_col labelling each one's subset; each
+    breakdown is cleaned and grouped once over the whole frame. Results are
+    dicts of subset (plus "all") to the frame the single-subset classes give.
+    """
+
+    def __init__(self, input_df, subset_col, subsets, agg_on):
+        self.subset_col = subset_col
+        self.subsets = subsets
+        super().__init__(input_df, agg_on)
+
+    def _build(self, df, group_on, also_nan):
+        return subset_groupby_df_build(
+            df,
+            self.subset_col,
+            group_on,
+            self.agg_on,
+            "count",
+            self.subsets,
+            also_nan=also_nan,
+        )
+
+    @profiling.profiled("age demographics")
+    def create_ages_groupby_dfs(
+        self, birthdt_col_name, reference_col_name, bins, pre_calc_age_column=None
+    ):
+        profiling.set_rows(len(self.input_df))
+        age_bin_df = AgeDemographics(
+            input_df=self.input_df,
+            birthdt_col_name=birthdt_col_name,
+            reference_col_name=reference_col_name,
+            agg_on=self.agg_on,
+            bins=bins,
+        )._create_age_bin_df(
+            pre_calc_age_column=pre_calc_age_column, keep=[self.subset_col]
+        )
+        return self._build(age_bin_df, "age_category", also_nan="nan")
+
+    @profiling.profiled("gender demographics")
+    def create_genders_groupby_dfs(self, gender_col):
+        profiling.set_rows(len(self.input_df))
+        cleaned_df = clean.clean_gender_column(self.input_df, gender_col)
+        return self._build(cleaned_df, "_cleaned_gender", also_nan="undetermined")
+
+    @profiling.profiled("race demographics")
+    def create_races_groupby_dfs(
+        self, race_col, ethnic_col=None, also_nan="nan", lowercase_first=False
+    ):
+        profiling.set_rows(len(self.input_df))
+        if ethnic_col is not None:
+            races_df = clean.EthnicRaceColumnCombiner(
+                self.input_df, race_col, ethnic_col, app_config.demo_codes
+            ).create_snapshot_race_df()
+            return self._build(races_df, "snapshot_race", also_nan=also_nan)
+
+        races_df = self.input_df
+        if lowercase_first:  # useful for JAC and TLP (human entered entries)
+            races_df = races_df.assign(**{race_col: races_df[race_col].str.lower()})
+        return self._build(races_df, race_col, also_nan=also_nan)
+
+
 if __name__ == "__main__":
     pass
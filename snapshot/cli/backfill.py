@@ -0,0 +1,327 @@
+import os
+import traceback
+from snapshot.config import app_config
+import snapshot.utilities.dates as sud
+
+PROGRAMS = ("shelter", "nonres", "snap", "tlp", "jac")
+
+# the long-format table, one row per number in a response
+METRIC_COLUMNS = ["end_dt", "start_dt", "program", "metric", "row", "column", "value"]
+
+_BLOCK_BYTES = 1024**2
+
+
+def month_ends(root, first=None, last=None):
+    """the month ends of the "Month YYYY" folders under root, oldest first"""
+    found = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            end_dt = sud.folder_to_end_dt(entry.name) if entry.is_dir() else None
+            if end_dt is None:
+                continue
+            if (first is None or end_dt >= first) and (last is None or end_dt <= last):
+                found.append(end_dt)
+    return sorted(found)
+
+
+def report_start(end_dt, period):
+    """the report period start for a month, the fiscal year's or the month's"""
+    if period == "fy":
+        return sud.fy_start_for(end_dt)
+    return sud.calc_month_start_from_end_dt(end_dt=end_dt)
+
+
+def metric_rows(program, response, start_dt, end_dt):
+    """
+    A response dict as long-format rows. Frames give a row per cell and
+    series a row per entry (row and column are their labels), numbers a
+    single row. Durations are in days.
+    """
+    import pandas as pd
+
+    rows = []
+
+    def add(metric, value, row="", column=""):
+        if isinstance(value, pd.Timedelta):
+            value = value / pd.Timedelta(days=1)
+        rows.append((end_dt, start_dt, program, metric, str(row), str(column), value))
+
+    for metric, value in response.items():
+        if isinstance(value, pd.DataFrame):
+            for row, values in value.iterrows():
+                for column, cell in values.items():
+                    add(metric, cell, row, column)
+        elif isinstance(value, pd.Series):
+            for row, cell in value.items():
+                add(metric, cell, row)
+        elif isinstance(value, (tuple, list)):
+            # some counts come back wrapped in a one item tuple
+            if len(value) == 1:
+                add(metric, value[0])
+            else:
+                for i, item in enumerate(value):
+                    add(metric, item, i)
+        else:
+            add(metric, value)
+    return pd.DataFrame(rows, columns=METRIC_COLUMNS)
+
+
+def run_month(end_dt, start_dt, production, programs):
+    """
+    Runs the programs for one month on a shared session. Returns program ->
+    rows for those that ran and program -> traceback for those that failed.
+    """
+    import snapshot.foundation.fetch_files as ff
+    from snapshot.cli.snapshot import SNAPSHOTS
+
+    funcs = {func.__name__: func for func in SNAPSHOTS}
+    session = ff.LoadSession.from_config()
+    rows, errors = {}, {}
+    for program in programs:
+        try:
+            response = funcs[program](start_dt, end_dt, production, session=session)
+        except Exception:
+            errors[program] = traceback.format_exc()
+        else:
+            rows[program] = metric_rows(program, response, start_dt, end_dt)
+    return rows, errors
+
+
+def input_files(end_dt, production, programs):
+    from snapshot.cli.snapshot import SNAPSHOTS
+
+    fpaths = []
+    for func in SNAPSHOTS:
+        if func.__name__ in programs:
+            for fpath in func.input_files(end_dt, production):
+                if fpath not in fpaths:
+                    fpaths.append(fpath)
+    return fpaths
+
+
+def _warm(fpaths):
+    """
+    Reads the files through once (and drops what's read) so the worker that
+    parses them next finds them in the OS cache instead of on the drive
+    """
+    for fpath in fpaths:
+        try:
+            with open(fpath, "rb") as f:
+                while f.read(_BLOCK_BYTES):
+                    pass
+        except OSError:
+            # a file that isn't where expected is searched for by the worker
+            pass
+
+
+class Checkpoints:
+    """
+    The rows of each finished (month, program), one pickle apiece, so an
+    interrupted backfill picks up with what's left. They are kept apart per
+    period and production/dev, so a run never reuses another's rows; start
+    over (clear) after changing the data or the code.
+    """
+
+    def __init__(self, checkpoint_dir, period, production):
+        self.checkpoint_dir = checkpoint_dir
+        self.period = period
+        self.production = production
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def _path(self, end_dt, program):
+        root = "production" if self.production else "dev"
+        return os.path.join(
+            self.checkpoint_dir,
+            f"{end_dt.strftime('%Y-%m')}-{self.period}-{root}-{program}.pkl",
+        )
+
+    def missing(self, end_dt, programs):
+        return [p for p in programs if not os.path.exists(self._path(end_dt, p))]
+
+    def save(self, end_dt, program, rows):
+        fpath = self._path(end_dt, program)
+        tmp_fpath = f"{fpath}.{os.getpid()}.tmp"
+        rows.to_pickle(tmp_fpath)
+        os.replace(tmp_fpath, fpath)
+
+    def load(self, end_dt, program):
+        import pandas as pd
+
+        return pd.read_pickle(self._path(end_dt, program))
+
+    def clear(self):
+        for fname in os.listdir(self.checkpoint_dir):
+            if fname.endswith(".pkl"):
+                os.remove(os.path.join(self.checkpoint_dir, fname))
+
+
+def backfill(months, programs, checkpoints, jobs=1, prefetch=True):
+    """
+    Runs the programs for every month not yet checkpointed (for the
+    checkpoints' period and production), a month per task in a pool of jobs
+    processes. While they compute, the next month's files are read ahead
+    (prefetch). Returns the (month, program) pairs that failed, a failure
+    is reported and the rest carry on.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor
+    from concurrent.futures import ThreadPoolExecutor, wait
+    from concurrent.futures.process import BrokenProcessPool
+
+    production = checkpoints.production
+    pending = []
+    for end_dt in months:
+        todo = checkpoints.missing(end_dt, programs)
+        if todo:
+            pending.append((end_dt, todo))
+    print(f"{len(months) - len(pending)} of {len(months)} months checkpointed")
+
+    failed = []
+    running = {}
+    pool = ProcessPoolExecutor(max_workers=jobs)
+    warmer = ThreadPoolExecutor(max_workers=1)
+
+    def submit_next():
+        end_dt, todo = pending.pop(0)
+        start_dt = report_start(end_dt, checkpoints.period)
+        future = pool.submit(run_month, end_dt, start_dt, production, todo)
+        running[future] = end_dt
+        if prefetch and pending:
+            next_end_dt, next_todo = pending[0]
+            warmer.submit(_warm, input_files(next_end_dt, production, next_todo))
+
+    def report_failed(end_dt, program, error):
+        folder = sud.end_dt_to_folder(end_dt=end_dt)
+        failed.append((end_dt, program))
+        print(f"{folder}: {program} failed\n{error}", flush=True)
+
+    try:
+        while pending or running:
+            while pending and len(running) < jobs:
+                submit_next()
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                end_dt = running.pop(future)
+                try:
+                    rows, errors = future.result()
+                except BrokenProcessPool:
+                    # a worker died (e.g. out of memory) and took the pool
+                    broken = True
+                    rows, errors = {}, {"all": traceback.format_exc()}
+                except Exception:
+                    rows, errors = {}, {"all": traceback.format_exc()}
+                for program, program_rows in rows.items():
+                    checkpoints.save(end_dt, program, program_rows)
+                if rows:
+                    folder = sud.end_dt_to_folder(end_dt=end_dt)
+                    print(f"{folder}: done ({', '.join(rows)})", flush=True)
+                for program, error in errors.items():
+                    report_failed(end_dt, program, error)
+            if broken:
+                # which month killed it can't be told, so all it ran failed
+                for future, end_dt in running.items():
+                    report_failed(end_dt, "all", "lost with the broken pool")
+                running.clear()
+                pool.shutdown(wait=False)
+                pool = ProcessPoolExecutor(max_workers=jobs)
+    finally:
+        pool.shutdown()
+        warmer.shutdown()
+    return failed
+
+
+def metrics_table(months, programs, checkpoints):
+    """the checkpointed rows of the months and programs as one frame"""
+    import pandas as pd
+
+    frames = [
+        checkpoints.load(end_dt, program)
+        for end_dt in months
+        for program in programs
+        if not checkpoints.missing(end_dt, [program])
+    ]
+    if not frames:
+        return pd.DataFrame(columns=METRIC_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def backfill_cli():
+
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Use to rebuild the report metrics for every month folder"
+    )
+
+    parser.add_argument(
+        "--programs",
+        nargs="+",
+        choices=PROGRAMS,
+        default=list(PROGRAMS),
+        help="(default: all)",
+    )
+    parser.add_argument(
+        "--from", dest="first", type=sud.to_timestamp, help="first month end to run"
+    )
+    parser.add_argument(
+        "--to", dest="last", type=sud.to_timestamp, help="last month end to run"
+    )
+    parser.add_argument(
+        "--period",
+        choices=["fy", "month"],
+        default="fy",
+        help="report each month for its fiscal year to date or on its own "
+        "(default: fy)",
+    )
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes")
+    parser.add_argument("--out", default="backfill.csv", help="the metrics table")
+    parser.add_argument(
+        "--checkpoint-dir",
+        default=None,
+        help="where finished months are kept (default: <out>.checkpoints)",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="drop the checkpoints and run every month again",
+    )
+    parser.add_argument(
+        "--no-prefetch",
+        action="store_true",
+        help="don't read the next month's files ahead",
+    )
+    parser.add_argument("--dev", action="store_true")
+
+    args = parser.parse_args()
+    production = not args.dev
+    root = app_config.production_root if production else app_config.dev_root
+    # kept in the order the reports run in
+    programs = [program for program in PROGRAMS if program in args.programs]
+
+    checkpoints = Checkpoints(
+        args.checkpoint_dir or f"{args.out}.checkpoints", args.period, production
+    )
+    if args.restart:
+        checkpoints.clear()
+
+    months = month_ends(root, args.first, args.last)
+    if not months:
+        sys.exit(f"No month folders found under {root}")
+    failed = backfill(
+        months, programs, checkpoints, jobs=args.jobs, prefetch=not args.no_prefetch
+    )
+
+    table = metrics_table(months, programs, checkpoints)
+    table.to_csv(args.out, index=False)
+    print(f"{len(table)} rows written to {args.out}")
+    if failed:
+        failures = ", ".join(
+            f"{sud.end_dt_to_folder(end_dt=end_dt)} {program}"
+            for end_dt, program in failed
+        )
+        sys.exit(f"failed: {failures} (run again to retry them)")
+
+
+if __name__ == "__main__":
+    backfill_cli()
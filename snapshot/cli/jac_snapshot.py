@@ -1,26 +1,27 @@
 import os
-from snapshot.analysis import analysis, demographics
+from snapshot.cli import output
 from snapshot.config import app_config
-import snapshot.foundation.fetch_files as ff
+import snapshot.foundation.results_cache as rc
 import snapshot.utilities.dates as sud
+import snapshot.utilities.profiling as profiling
 
 
-def jac(start_dt, end_dt, production):
-
-    folder = sud.end_dt_to_folder(end_dt=end_dt)
-    root = app_config.production_root if production else app_config.dev_root
+@profiling.profiled("jac")
+@rc.cached_report(config_sections=["jac"], input_files=rc.jac_input_files)
+def jac(start_dt, end_dt, production, session=None):
+    import snapshot.analysis.analysis as analysis
+    import snapshot.analysis.demographics as demographics
+    import snapshot.foundation.fetch_files as ff
 
     pre_calc_age_column = app_config.jac_pre_calc_age_column
 
     if pre_calc_age_column is not None:
         print("***Attempting to use pre-calculated ages from data source")
 
-    jac_df = ff.ExcelRead(
-        filename=app_config.jac_filename,
-        dir_=os.path.join(root, folder),
-        parse_dates=app_config.jac_parse_dates,
-        skiprows=None,
-    ).fetch_excel()
+    if session is None:
+        session = ff.LoadSession.from_config()
+
+    jac_df = session.fetch_excel(**jac_workbook(end_dt, production))
 
     ja = (
         analysis.JACAnalysis(
@@ -63,73 +64,26 @@ def jac(start_dt, end_dt, production):
     )
 
     # there are no "intakes" and "exits" in the same sense as the other programs
-    served_df = ja.rp_served_df
-    served_ntr_df = ja.rp_ntr_served_df
-    served_cc_df = ja.rp_cc_served_df
-
-    age_demos = demographics.AgeDemographics(
-        input_df=served_df,
-        birthdt_col_name=app_config.jac_birth_dt_column,
-        reference_col_name=app_config.jac_served_dt_column,
+    # every subset's demographics come from one pass over the rp served rows
+    subset_demos = demographics.SubsetDemographics(
+        input_df=ja.labeled_served_df(period="rp", label_col="_subset"),
+        subset_col="_subset",
+        subsets=["ntr", "cc"],
         agg_on=app_config.jac_id_column,
-        bins=app_config.jac_age_bins,
-    ).create_ages_groupby_df(pre_calc_age_column=pre_calc_age_column)
-
-    gender_demos = demographics.GenderDemographics(
-        input_df=served_df,
-        group_on=app_config.jac_gender_column,
-        agg_on=app_config.jac_id_column,
-    ).create_genders_groupby_df()
-
-    race_demos = demographics.RaceDemographics(
-        input_df=served_df,
-        group_on=app_config.jac_race_column,
-        agg_on=app_config.jac_id_column,
-    ).create_races_groupby_df(
-        race_col=app_config.jac_race_column, also_nan=["~", "na", "nan"]
     )
 
-    ntr_age_demos = demographics.AgeDemographics(
-        input_df=served_ntr_df,
+    age_demos = subset_demos.create_ages_groupby_dfs(
         birthdt_col_name=app_config.jac_birth_dt_column,
         reference_col_name=app_config.jac_served_dt_column,
-        agg_on=app_config.jac_id_column,
         bins=app_config.jac_age_bins,
-    ).create_ages_groupby_df(pre_calc_age_column=pre_calc_age_column)
-
-    ntr_gender_demos = demographics.GenderDemographics(
-        input_df=served_ntr_df,
-        group_on=app_config.jac_gender_column,
-        agg_on=app_config.jac_id_column,
-    ).create_genders_groupby_df()
-
-    ntr_race_demos = demographics.RaceDemographics(
-        input_df=served_ntr_df,
-        group_on=app_config.jac_race_column,
-        agg_on=app_config.jac_id_column,
-    ).create_races_groupby_df(
-        race_col=app_config.jac_race_column, also_nan=["~", "na", "nan"]
+        pre_calc_age_column=pre_calc_age_column,
     )
 
-    cc_age_demos = demographics.AgeDemographics(
-        input_df=served_cc_df,
-        birthdt_col_name=app_config.jac_birth_dt_column,
-        reference_col_name=app_config.jac_served_dt_column,
-        agg_on=app_config.jac_id_column,
-        bins=app_config.jac_age_bins,
-    ).create_ages_groupby_df(pre_calc_age_column=pre_calc_age_column)
-
-    cc_gender_demos = demographics.GenderDemographics(
-        input_df=served_cc_df,
-        group_on=app_config.jac_gender_column,
-        agg_on=app_config.jac_id_column,
-    ).create_genders_groupby_df()
+    gender_demos = subset_demos.create_genders_groupby_dfs(
+        gender_col=app_config.jac_gender_column
+    )
 
-    cc_race_demos = demographics.RaceDemographics(
-        input_df=served_cc_df,
-        group_on=app_config.jac_race_column,
-        agg_on=app_config.jac_id_column,
-    ).create_races_groupby_df(
+    race_demos = subset_demos.create_races_groupby_dfs(
         race_col=app_config.jac_race_column, also_nan=["~", "na", "nan"]
     )
 
@@ -143,48 +97,52 @@ def jac(start_dt, end_dt, production):
         "referral-source": rp_all_ref_source_df,
         "referral-source-ntr": rp_ntr_ref_source_df,
         "referral-source-cc": rp_cc_ref_source_df,
-        "age-demographics": age_demos,
-        "gender-demographics": gender_demos,
-        "race-demographics": race_demos,
-        "ntr-age-demographics": ntr_age_demos,
-        "ntr-gender-demographics": ntr_gender_demos,
-        "ntr-race-demographics": ntr_race_demos,
-        "cc-age-demographics": cc_age_demos,
-        "cc-gender-demographics": cc_gender_demos,
-        "cc-race-demographics": cc_race_demos,
+        "age-demographics": age_demos["all"],
+        "gender-demographics": gender_demos["all"],
+        "race-demographics": race_demos["all"],
+        "ntr-age-demographics": age_demos["ntr"],
+        "ntr-gender-demographics": gender_demos["ntr"],
+        "ntr-race-demographics": race_demos["ntr"],
+        "cc-age-demographics": age_demos["cc"],
+        "cc-gender-demographics": gender_demos["cc"],
+        "cc-race-demographics": race_demos["cc"],
     }
 
 
+def jac_workbook(end_dt, production):
+    """the fetch_excel arguments for the month's JAC roster"""
+    folder = sud.end_dt_to_folder(end_dt=end_dt)
+    root = app_config.production_root if production else app_config.dev_root
+    return dict(
+        filename=app_config.jac_filename,
+        dir_=os.path.join(root, folder),
+        parse_dates=app_config.jac_parse_dates,
+        categoricals=app_config.categorical_columns.get("jac"),
+        skiprows=None,
+    )
+
+
 def jac_cli():
 
     import argparse
-    import pandas as pd
 
     parser = argparse.ArgumentParser(
         description="Use to run analysis that appears on the JAC snapshot"
     )
 
-    parser.add_argument("start_date", type=lambda x: pd.Timestamp(x))
-    parser.add_argument("end_date", type=lambda x: pd.Timestamp(x))
+    parser.add_argument("start_date", type=sud.to_timestamp)
+    parser.add_argument("end_date", type=sud.to_timestamp)
     parser.add_argument("--dev", action="store_true")
+    profiling.add_arguments(parser, "jac")
 
     args = parser.parse_args()
     start = args.start_date
     end = args.end_date
-    production = True
-
-    start_str = start.strftime("%m/%d/%Y")
-    end_str = end.strftime("%m/%d/%Y")
-    print(f"\nReport Period: {start_str} - {end_str}")
-
-    if args.dev:
-        print("---running in dev mode")
-        production = False
+    production = not args.dev
+    output.print_report_period(start, end, production)
 
-    print()
-    for key, value in jac(start, end, production=production).items():
-        print(f"{key}:\n {value}")
-        print("------------")
+    with profiling.cli_profile(args):
+        output.print_response(jac(start, end, production=production))
 
 
 if __name__ == "__main__":
@@ -1,22 +1,35 @@
 import os
-import snapshot.analysis.analysis as analysis
-import snapshot.analysis.demographics as demographics
+from snapshot.cli import output
 from snapshot.config import app_config
-import snapshot.foundation.fetch_files as ff
+import snapshot.foundation.results_cache as rc
 import snapshot.utilities.dates as sud
+import snapshot.utilities.profiling as profiling
 
 
-def nonres(start_dt, end_dt, production):
+@profiling.profiled("nonres")
+@rc.cached_report(
+    config_sections=["network_data_presets", "nonres"],
+    input_files=rc.network_input_files,
+)
+def nonres(start_dt, end_dt, production, session=None):
+    import snapshot.analysis.analysis as analysis
+    import snapshot.analysis.demographics as demographics
+    import snapshot.foundation.fetch_files as ff
+
     folder = sud.end_dt_to_folder(end_dt=end_dt)
     root = app_config.production_root if production else app_config.dev_root
 
-    vtr = ff.VTrimRead(
+    if session is None:
+        session = ff.LoadSession.from_config()
+
+    dfs_dict = session.get_name_df_dictionary(
         fn_ylog=app_config.fn_ylog,
         fn_youth=app_config.fn_youth,
         fn_a_programs=app_config.fn_a_programs,
         dir_=os.path.join(root, folder),
+        rp_start_dt=start_dt,
+        end_dt=end_dt,
     )
-    dfs_dict = vtr.get_name_df_dictionary()
 
     # calculate month start here
     month_start_dt = sud.calc_month_start_from_end_dt(end_dt=end_dt)
@@ -32,6 +45,9 @@ def nonres(start_dt, end_dt, production):
         exit_col=app_config.exit_dt_column,
         ylog_youth_merge_on=app_config.youth_id_column,
         intermed_aprogs_merge_on=app_config.program_id_column,
+        prog_name_col=app_config.program_name_column,
+        intra_program_list=app_config.nonres_program_names,
+        columns=app_config.demographic_columns,
     )
     na.set_analysis_dfs(
         prog_name_col=app_config.program_name_column,
@@ -106,33 +122,24 @@ def nonres(start_dt, end_dt, production):
 
 def nonres_cli():
     import argparse
-    import pandas as pd
 
     parser = argparse.ArgumentParser(
         description="Use to run analysis that appears on the NonRes snapshot"
     )
 
-    parser.add_argument("start_date", type=lambda x: pd.Timestamp(x))
-    parser.add_argument("end_date", type=lambda x: pd.Timestamp(x))
+    parser.add_argument("start_date", type=sud.to_timestamp)
+    parser.add_argument("end_date", type=sud.to_timestamp)
     parser.add_argument("--dev", action="store_true")
+    profiling.add_arguments(parser, "nonres")
 
     args = parser.parse_args()
     start = args.start_date
     end = args.end_date
-    production = True
-
-    start_str = start.strftime("%m/%d/%Y")
-    end_str = end.strftime("%m/%d/%Y")
-    print(f"\nReport Period: {start_str} - {end_str}")
-
-    if args.dev:
-        print("---running in dev mode")
-        production = False
+    production = not args.dev
+    output.print_report_period(start, end, production)
 
-    print()
-    for key, value in nonres(start, end, production=production).items():
-        print(f"{key}:\n {value}")
-        print("------------")
+    with profiling.cli_profile(args):
+        output.print_response(nonres(start, end, production=production))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,30 @@
+def print_report_period(start_dt, end_dt, production):
+    start_str = start_dt.strftime("%m/%d/%Y")
+    end_str = end_dt.strftime("%m/%d/%Y")
+    print(f"\nReport Period: {start_str} - {end_str}")
+
+    if not production:
+        print("---running in dev mode")
+
+    print()
+
+
+def print_response(response_dict):
+    for key, value in response_dict.items():
+        print(f"{key}:\n {value}")
+        print("------------")
+
+
+def print_responses(responses):
+    """the responses of several programs, each under a banner of its name"""
+    for prog_name, response_dict in responses.items():
+        name_len = len(prog_name)
+        line = "--------------------"
+        print(f"\n+{line}+")
+        print(f"|{line[:4]}{prog_name.upper()}{line[4+name_len:]}|")
+        print(f"+{line}+\n")
+        print_response(response_dict)
+
+
+if __name__ == "__main__":
+    pass
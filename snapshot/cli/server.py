@@ -0,0 +1,354 @@
+import contextlib
+import io
+import json
+import os
+import stat
+import time
+import traceback
+from collections import OrderedDict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+REPORTS = ("shelter", "nonres", "snap", "tlp", "jac", "snapshot")
+
+
+def state_path():
+    """where a running server leaves its address and key for the client"""
+    return os.path.join(_state_dir(), "snapshot-server.json")
+
+
+def _state_dir():
+    """
+    a directory only this user can get into: XDG_RUNTIME_DIR where there is
+    one, else ~/.snapshot (made 0700)
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir) and _is_private(runtime_dir):
+        return runtime_dir
+    state_dir = os.path.join(os.path.expanduser("~"), ".snapshot")
+    os.makedirs(state_dir, mode=0o700, exist_ok=True)
+    if not _is_private(state_dir):
+        raise PermissionError(
+            f"{state_dir} must be owned by you and closed to others (chmod 700)."
+        )
+    return state_dir
+
+
+def _is_private(fpath, st=None):
+    """owned by this user and closed to the group and others (posix only)"""
+    if not hasattr(os, "getuid"):
+        # windows, the profile directory is already private to its user
+        return True
+    st = os.stat(fpath) if st is None else st
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IRWXG | stat.S_IRWXO)
+
+
+def _read_state():
+    """the state file's contents, refused unless it is this user's and 0600"""
+    flags = os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0)
+    fd = os.open(state_path(), flags)
+    with os.fdopen(fd, "r") as f:
+        if not _is_private(state_path(), os.fstat(f.fileno())):
+            raise PermissionError(f"{state_path()} is not private to you.")
+        return json.load(f)
+
+
+class SnapshotServer:
+    """
+    Answers report requests from a resident LoadSession per month folder,
+    so each month's files are parsed once and only the reports run per
+    request. y_log is held whole (not streamed) so any report period
+    reuses it. Once a month's input files change on disk its session is
+    started over, and past max_sessions months the least recently asked
+    for is dropped.
+
+    Listens on localhost only; a client needs the random key the server
+    writes to state_path() (readable by the same user only).
+    """
+
+    def __init__(self, address=("localhost", 0), max_sessions=3):
+        self.authkey = os.urandom(32)
+        self.listener = Listener(address, authkey=self.authkey)
+        self.max_sessions = max_sessions
+        # (month folder, production) -> (session, input file stamps)
+        self._sessions = OrderedDict()
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def _report_funcs(self):
+        from snapshot.cli.snapshot import SNAPSHOTS, run_all
+
+        funcs = {func.__name__: func for func in SNAPSHOTS}
+        funcs["snapshot"] = run_all
+        return funcs
+
+    def _session(self, func, end_dt, production):
+        """
+        the month's session, a new one if any of the report's files changed
+        since seen
+        """
+        import snapshot.foundation.fetch_files as ff
+        import snapshot.utilities.dates as sud
+
+        stamps = {}
+        for fpath in func.input_files(end_dt, production):
+            try:
+                st = os.stat(fpath)
+                stamps[fpath] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                stamps[fpath] = None
+
+        key = (sud.end_dt_to_folder(end_dt=end_dt), production)
+        session, seen = self._sessions.pop(key, (None, {}))
+        if any(
+            fpath in seen and seen[fpath] != stamp for fpath, stamp in stamps.items()
+        ):
+            session, seen = None, {}
+        if session is None:
+            session = ff.LoadSession.from_config(chunksize=None)
+        seen.update(stamps)
+        self._sessions[key] = (session, seen)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session
+
+    def handle(self, request):
+        """the reply to a request, a report's printed output (and response)"""
+        command = request.get("command", "report")
+        if command == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        if command == "stop":
+            return {"ok": True, "stop": True}
+
+        import pandas as pd
+        from snapshot.cli import output
+
+        report = request["report"]
+        func = self._report_funcs()[report]
+        start_dt = pd.Timestamp(request["start_date"])
+        end_dt = pd.Timestamp(request["end_date"])
+        production = request["production"]
+
+        session = self._session(func, end_dt, production)
+
+        # captured so the client prints exactly what the cli would
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            output.print_report_period(start_dt, end_dt, production)
+            response = func(start_dt, end_dt, production, session=session)
+            if report == "snapshot":
+                output.print_responses(response)
+            else:
+                output.print_response(response)
+
+        reply = {"ok": True, "output": printed.getvalue()}
+        if request.get("raw"):
+            reply["response"] = response
+        return reply
+
+    def preload(self, end_date, production):
+        """loads a month's files by running every report on it once"""
+        from snapshot.config import app_config
+
+        # a cached result would skip the loads this is for
+        results_cache_dir = app_config.results_cache_dir
+        app_config.results_cache_dir = None
+        try:
+            reply = self.handle(
+                {
+                    "report": "snapshot",
+                    "start_date": end_date,
+                    "end_date": end_date,
+                    "production": production,
+                }
+            )
+        finally:
+            app_config.results_cache_dir = results_cache_dir
+        if not reply["ok"]:
+            raise RuntimeError(reply["error"])
+
+    def serve_forever(self):
+        self._write_state()
+        try:
+            while True:
+                try:
+                    conn = self.listener.accept()
+                except (AuthenticationError, OSError, EOFError):
+                    continue
+                with conn:
+                    try:
+                        request = conn.recv()
+                    except EOFError:
+                        continue
+                    start = time.perf_counter()
+                    try:
+                        reply = self.handle(request)
+                    except Exception:
+                        reply = {"ok": False, "error": traceback.format_exc()}
+                    conn.send(reply)
+                    _log_request(request, reply, time.perf_counter() - start)
+                if reply.get("stop"):
+                    break
+        finally:
+            self.listener.close()
+            self._remove_state()
+
+    def _write_state(self):
+        host, port = self.address
+        state = {
+            "address": [host, port],
+            "authkey": self.authkey.hex(),
+            "pid": os.getpid(),
+        }
+        # made afresh so a file someone else left there is never written into
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(state_path())
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0)
+        fd = os.open(state_path(), flags, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+
+    def _remove_state(self):
+        try:
+            if _read_state().get("pid") == os.getpid():
+                os.remove(state_path())
+        except (OSError, ValueError):
+            pass
+
+
+def _log_request(request, reply, seconds):
+    if "report" in request:
+        what = f"{request['report']} {request['start_date']} - {request['end_date']}"
+        if not request.get("production"):
+            what += " (dev)"
+    else:
+        what = request.get("command", "?")
+    status = "ok" if reply.get("ok") else "failed"
+    print(f"{what}: {status} in {seconds:.3f}s", flush=True)
+
+
+def request(payload):
+    """sends one request to the running server and returns its reply"""
+    try:
+        state = _read_state()
+    except PermissionError as e:
+        raise ConnectionError(f"Not trusting the snapshot server's state file: {e}")
+    except (OSError, ValueError):
+        raise ConnectionError(
+            "No snapshot server is running, start one with snapshot-server."
+        )
+    address = tuple(state["address"])
+    try:
+        conn = Client(address, authkey=bytes.fromhex(state["authkey"]))
+    except OSError:
+        raise ConnectionError(
+            f"The snapshot server at {address[0]}:{address[1]} is not answering, "
+            "start one with snapshot-server."
+        )
+    with conn:
+        conn.send(payload)
+        return conn.recv()
+
+
+def report(name, start_date, end_date, production=True):
+    """a report's response dict from the server (needs pandas to unpickle)"""
+    reply = request(
+        {
+            "report": name,
+            "start_date": str(start_date),
+            "end_date": str(end_date),
+            "production": production,
+            "raw": True,
+        }
+    )
+    if not reply["ok"]:
+        raise RuntimeError(f"The snapshot server failed:\n{reply['error']}")
+    return reply["response"]
+
+
+def server_cli():
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Use to keep the month data loaded and answer snapshot-client"
+    )
+
+    parser.add_argument("--port", type=int, default=0, help="(default: any free)")
+    parser.add_argument(
+        "--preload",
+        nargs="+",
+        default=[],
+        metavar="END_DATE",
+        help="month end dates whose data to load before serving",
+    )
+    parser.add_argument("--dev", action="store_true", help="preload the dev data")
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        default=3,
+        help="months to keep loaded at once (default: 3)",
+    )
+
+    args = parser.parse_args()
+    server = SnapshotServer(
+        address=("localhost", args.port), max_sessions=max(args.sessions, 1)
+    )
+
+    for end_date in args.preload:
+        print(f"loading the month ending {end_date}", flush=True)
+        try:
+            server.preload(end_date, production=not args.dev)
+        except Exception:
+            traceback.print_exc()
+
+    host, port = server.address
+    print(f"serving on {host}:{port} (stop with: snapshot-client stop)", flush=True)
+    server.serve_forever()
+
+
+def client_cli():
+
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Use to run a report on the running snapshot-server"
+    )
+
+    parser.add_argument("report", choices=REPORTS + ("ping", "stop"))
+    parser.add_argument("start_date", nargs="?")
+    parser.add_argument("end_date", nargs="?")
+    parser.add_argument("--dev", action="store_true")
+
+    args = parser.parse_args()
+    if args.report in ("ping", "stop"):
+        payload = {"command": args.report}
+    elif args.start_date is None or args.end_date is None:
+        parser.error(f"{args.report} needs a start_date and an end_date")
+    else:
+        payload = {
+            "report": args.report,
+            "start_date": args.start_date,
+            "end_date": args.end_date,
+            "production": not args.dev,
+        }
+
+    try:
+        reply = request(payload)
+    except ConnectionError as e:
+        sys.exit(str(e))
+    if not reply["ok"]:
+        sys.exit(reply["error"])
+    if args.report == "ping":
+        print(f"snapshot server running (pid {reply['pid']})")
+    elif args.report == "stop":
+        print("snapshot server stopped")
+    else:
+        print(reply["output"], end="")
+
+
+if __name__ == "__main__":
+    server_cli()
@@ -1,64 +1,134 @@
 import os
-import snapshot.analysis.analysis as analysis
-import snapshot.analysis.demographics as demographics
+from snapshot.cli import output
 from snapshot.config import app_config
-from snapshot.cli.jac_snapshot import jac
+from snapshot.cli.jac_snapshot import jac, jac_workbook
 from snapshot.cli.nonres_snapshot import nonres
 from snapshot.cli.shelter_snapshot import shelter
 from snapshot.cli.snap_snapshot import snap
-from snapshot.cli.tlp_snapshot import tlp
-import snapshot.foundation.fetch_files as ff
+from snapshot.cli.tlp_snapshot import tlp, tlp_workbook
+import snapshot.foundation.results_cache as rc
+import snapshot.utilities.dates as sud
+import snapshot.utilities.profiling as profiling
+
+SNAPSHOTS = (shelter, nonres, snap, tlp, jac)
+
+# each worker process keeps its own session so programs that land on the
+# same worker still share their loads
+_worker_session = None
+
+
+def _all_input_files(end_dt, production):
+    return [
+        fpath for func in SNAPSHOTS for fpath in func.input_files(end_dt, production)
+    ]
+
+
+@rc.cached_report(
+    config_sections=sorted({s for func in SNAPSHOTS for s in func.config_sections}),
+    input_files=_all_input_files,
+)
+def run_all(start_dt, end_dt, production, session=None, jobs=1):
+    """
+    Every program's response. A session (and workbook prefetching) applies
+    to serial runs only, with jobs > 1 each worker keeps its own.
+    """
+    if jobs > 1:
+        if session is not None:
+            raise ValueError("A session can't be shared with jobs > 1.")
+        return _run_all_parallel(start_dt, end_dt, production, jobs)
+
+    # the session is shared so each file is only read once for all programs
+    if session is None:
+        import snapshot.foundation.fetch_files as ff
+
+        session = ff.LoadSession.from_config()
+    if app_config.prefetch_workbooks:
+        # read on the session's threads while the network programs run
+        session.prefetch_excel(**tlp_workbook(end_dt, production))
+        session.prefetch_excel(**jac_workbook(end_dt, production))
 
-
-def run_all(start_dt, end_dt, production):
-    # an issue with this implementation will be that the loads (for the same data)
-    # occur more than once...
-    # regardless the program will be much faster than a human analyst
-
-    snapshots = (shelter, nonres, snap, tlp, jac)
     all_response = dict()
 
-    for func in snapshots:
-        response = func(start_dt, end_dt, production)
+    for func in SNAPSHOTS:
+        response = func(start_dt, end_dt, production, session=session)
         all_response[func.__name__] = response
 
     return all_response
 
 
+def _run_all_parallel(start_dt, end_dt, production, jobs):
+    """runs each program in a process pool, responses keep the serial order"""
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, len(SNAPSHOTS)), initializer=_init_worker
+    ) as pool:
+        futures = [
+            pool.submit(
+                _run_in_worker,
+                func,
+                start_dt,
+                end_dt,
+                production,
+                profiling.options(),
+            )
+            for func in SNAPSHOTS
+        ]
+        all_response = dict()
+        for func, future in zip(SNAPSHOTS, futures):
+            response, records = future.result()
+            # the workers' stages ran side by side so their shares can add past 100%
+            profiling.add_records(records)
+            all_response[func.__name__] = response
+        return all_response
+
+
+def _init_worker():
+    import snapshot.foundation.fetch_files as ff
+
+    global _worker_session
+    _worker_session = ff.LoadSession.from_config()
+
+
+def _run_in_worker(func, start_dt, end_dt, production, profile_options):
+    """the response and, if profiling, the worker's stages"""
+    if profile_options is None:
+        return func(start_dt, end_dt, production, session=_worker_session), None
+    profiling.start(**profile_options)
+    try:
+        response = func(start_dt, end_dt, production, session=_worker_session)
+    finally:
+        records = profiling.stop().records()
+    return response, records
+
+
 def all_cli():
 
     import argparse
-    import pandas as pd
 
     parser = argparse.ArgumentParser(description="Use to run analysis for all programs")
 
-    parser.add_argument("start_date", type=lambda x: pd.Timestamp(x))
-    parser.add_argument("end_date", type=lambda x: pd.Timestamp(x))
+    parser.add_argument("start_date", type=sud.to_timestamp)
+    parser.add_argument("end_date", type=sud.to_timestamp)
     parser.add_argument("--dev", action="store_true")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes to run the programs in (default: 1)",
+    )
+    profiling.add_arguments(parser, "snapshot")
 
     args = parser.parse_args()
     start = args.start_date
     end = args.end_date
-    production = True
-
-    start_str = start.strftime("%m/%d/%Y")
-    end_str = end.strftime("%m/%d/%Y")
-    print(f"\nReport Period: {start_str} - {end_str}")
-
-    if args.dev:
-        print("---running in dev mode")
-        production = False
-
-    print()
-    for prog_name, response_dict in run_all(start, end, production=production).items():
-        name_len = len(prog_name)
-        line = "--------------------"
-        print(f"\n+{line}+")
-        print(f"|{line[:4]}{prog_name.upper()}{line[4+name_len:]}|")
-        print(f"+{line}+\n")
-        for key, value in response_dict.items():
-            print(f"{key}:\n {value}")
-            print("------------")
+    production = not args.dev
+    output.print_report_period(start, end, production)
+
+    with profiling.cli_profile(args):
+        output.print_responses(
+            run_all(start, end, production=production, jobs=args.jobs)
+        )
 
 
 if __name__ == "__main__":
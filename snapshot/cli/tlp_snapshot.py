@@ -1,26 +1,26 @@
 import os
-import snapshot.analysis.analysis as analysis
-import snapshot.analysis.demographics as demographics
+from snapshot.cli import output
 from snapshot.config import app_config
-import snapshot.foundation.fetch_files as ff
+import snapshot.foundation.results_cache as rc
 import snapshot.utilities.dates as sud
+import snapshot.utilities.profiling as profiling
 
 
-def tlp(start_dt, end_dt, production):
-
-    folder = sud.end_dt_to_folder(end_dt=end_dt)
-    root = app_config.production_root if production else app_config.dev_root
+@profiling.profiled("tlp")
+@rc.cached_report(config_sections=["tlp"], input_files=rc.tlp_input_files)
+def tlp(start_dt, end_dt, production, session=None):
+    import snapshot.analysis.analysis as analysis
+    import snapshot.analysis.demographics as demographics
+    import snapshot.foundation.fetch_files as ff
 
     intake_col_name = app_config.tlp_intake_dt_column
     exit_col_name = app_config.tlp_exit_dt_column
     birthdt_col_name = app_config.tlp_birth_dt_column
 
-    tlp_df = ff.ExcelRead(
-        filename=app_config.tlp_filename,
-        dir_=os.path.join(root, folder),
-        parse_dates=app_config.tlp_parse_dates,
-        skiprows=[app_config.tlp_skiprows],
-    ).fetch_excel()
+    if session is None:
+        session = ff.LoadSession.from_config()
+
+    tlp_df = session.fetch_excel(**tlp_workbook(end_dt, production))
 
     ta = analysis.TLPAnalysis(
         prog_df=tlp_df,
@@ -115,36 +115,40 @@ def tlp(start_dt, end_dt, production):
     }
 
 
+def tlp_workbook(end_dt, production):
+    """the fetch_excel arguments for the month's TLP roster"""
+    folder = sud.end_dt_to_folder(end_dt=end_dt)
+    root = app_config.production_root if production else app_config.dev_root
+    return dict(
+        filename=app_config.tlp_filename,
+        dir_=os.path.join(root, folder),
+        parse_dates=app_config.tlp_parse_dates,
+        categoricals=app_config.categorical_columns.get("tlp"),
+        skiprows=[app_config.tlp_skiprows],
+    )
+
+
 def tlp_cli():
 
     import argparse
-    import pandas as pd
 
     parser = argparse.ArgumentParser(
         description="Use to run analysis that appears on the TLP snapshot"
     )
 
-    parser.add_argument("start_date", type=lambda x: pd.Timestamp(x))
-    parser.add_argument("end_date", type=lambda x: pd.Timestamp(x))
+    parser.add_argument("start_date", type=sud.to_timestamp)
+    parser.add_argument("end_date", type=sud.to_timestamp)
     parser.add_argument("--dev", action="store_true")
+    profiling.add_arguments(parser, "tlp")
 
     args = parser.parse_args()
     start = args.start_date
     end = args.end_date
-    production = True
-
-    start_str = start.strftime("%m/%d/%Y")
-    end_str = end.strftime("%m/%d/%Y")
-    print(f"\nReport Period: {start_str} - {end_str}")
-
-    if args.dev:
-        print("---running in dev mode")
-        production = False
+    production = not args.dev
+    output.print_report_period(start, end, production)
 
-    print()
-    for key, value in tlp(start, end, production=production).items():
-        print(f"{key}:\n {value}")
-        print("------------")
+    with profiling.cli_profile(args):
+        output.print_response(tlp(start, end, production=production))
 
 
 if __name__ == "__main__":
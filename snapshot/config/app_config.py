@@ -1,10 +1,50 @@
 # import pathlib
+import hashlib
 import os
-import yaml
+import pickle
 
 
-with open("config.yml", "r") as f:
-    config = yaml.safe_load(f)
+def _load_config(fpath):
+    """
+    The parsed yaml. Importing yaml and parsing are most of a small run's
+    startup so the result is kept pickled in this package's __pycache__ and
+    only parsed again once the file's mtime (or size) changes.
+    """
+    abs_fpath = os.path.abspath(fpath)
+    stat = os.stat(abs_fpath)
+    source = (abs_fpath, stat.st_mtime_ns, stat.st_size)
+    path_key = hashlib.sha1(abs_fpath.encode("utf-8")).hexdigest()
+    cache_path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "__pycache__",
+        f"config-{path_key}.pickle",
+    )
+    try:
+        with open(cache_path, "rb") as f:
+            cached_source, cached_config = pickle.load(f)
+        if cached_source == source:
+            return cached_config
+    except Exception:
+        # missing or unreadable just means parsing it
+        pass
+
+    import yaml
+
+    with open(fpath, "r") as f:
+        parsed = yaml.safe_load(f)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((source, parsed), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # e.g. a read-only install, it's just parsed every time
+        pass
+    return parsed
+
+
+config = _load_config("config.yml")
 
 production_root = os.path.normpath(config["paths"]["production"]["root"])
 dev_root = os.path.normpath(config["paths"]["dev"]["root"])
@@ -29,6 +69,8 @@ ethnic_column = ntwk_presets["ethnic_column"]
 program_name_column = ntwk_presets["program_name_column"]
 program_id_column = ntwk_presets["program_id_column"]
 intake_dt_column = ntwk_presets["intake_dt_column"]
+# what the network reports read off the merged frame besides dates and programs
+demographic_columns = [birth_dt_column, gender_column, race_column, ethnic_column]
 
 # uniques to programs
 shelter_program_names = ntwk_presets["shelter_program_names"]
@@ -70,5 +112,20 @@ jac_referral_source_column = jac_presets["referral_source_column"]
 jac_pre_calc_age_column = jac_presets["pre_calc_age_column"]
 jac_age_bins = [tuple(b) for b in config["jac"]["age_bins"]]
 
+# performance options, all optional (a config from before them runs as it did)
+perf_options = config.get("performance") or {}
+frame_cache_dir = perf_options.get("frame_cache_dir")
+y_log_chunksize = perf_options.get("y_log_chunksize")
+episode_store_dir = perf_options.get("episode_store_dir")
+catalog_dir = perf_options.get("catalog_dir")
+results_cache_dir = perf_options.get("results_cache_dir")
+results_cache_max_mb = perf_options.get("results_cache_max_mb", 256)
+load_workers = perf_options.get("load_workers")
+prefetch_workbooks = perf_options.get("prefetch_workbooks", False)
+categorical_columns = {
+    table: cols or []
+    for table, cols in (perf_options.get("categorical_columns") or {}).items()
+}
+
 if __name__ == "__main__":
     print()
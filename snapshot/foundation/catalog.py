@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class DataCatalog:
+    """
+    Index of the files in every month folder under a data root, mapping
+    (month folder, file name) to the file's path, size, and mtime. It is
+    kept on disk and refreshed incrementally: a directory is only listed
+    again when its mtime has changed (a file added, removed, or renamed in
+    it), otherwise its last listing is reused. Sizes and mtimes are as of
+    the last listing of their directory.
+
+    It stands in for walking a month folder when a file isn't where it is
+    expected. Lookups are dict hits; a miss (or a path that has since gone)
+    triggers a refresh before giving up.
+    """
+
+    def __init__(self, root, catalog_dir):
+        self.root = os.path.normpath(root)
+        self.catalog_dir = catalog_dir
+        os.makedirs(catalog_dir, exist_ok=True)
+        self._dirs = self._load()
+        self._index = None
+
+    @property
+    def catalog_path(self):
+        root_key = hashlib.sha1(os.path.abspath(self.root).encode("utf-8"))
+        return os.path.join(self.catalog_dir, f"{root_key.hexdigest()}.json")
+
+    def _load(self):
+        if not os.path.exists(self.catalog_path):
+            return {}
+        try:
+            with open(self.catalog_path, "r") as f:
+                return json.load(f)
+        except ValueError:
+            # a partial write just means starting over
+            return {}
+
+    def _save(self):
+        # per thread too, the extracts of a month can be resolved side by side
+        tmp_path = f"{self.catalog_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._dirs, f)
+        os.replace(tmp_path, self.catalog_path)
+
+    def refresh(self):
+        """re-lists only the directories that changed since the last refresh"""
+        dirs = {}
+        changed = self._refresh_dir("", dirs)
+        if changed or dirs.keys() != self._dirs.keys():
+            self._dirs = dirs
+            self._save()
+        self._index = None
+        return self
+
+    def _refresh_dir(self, rel_dir, dirs):
+        try:
+            mtime_ns = os.stat(os.path.join(self.root, rel_dir)).st_mtime_ns
+        except OSError:
+            return True
+        listing = self._dirs.get(rel_dir)
+        changed = listing is None or listing["mtime_ns"] != mtime_ns
+        if changed:
+            listing = _list_dir(os.path.join(self.root, rel_dir), mtime_ns)
+        dirs[rel_dir] = listing
+        for subdir in listing["subdirs"]:
+            changed |= self._refresh_dir(os.path.join(rel_dir, subdir), dirs)
+        return changed
+
+    @property
+    def index(self):
+        """(month folder, file name) -> relative path, shallowest path first"""
+        index = self._index
+        if index is None:
+            index = {}
+            for rel_dir in sorted(self._dirs, key=lambda d: (d.count(os.sep), d)):
+                folder = rel_dir.split(os.sep)[0]
+                for fname in self._dirs[rel_dir]["files"]:
+                    index.setdefault((folder, fname), os.path.join(rel_dir, fname))
+            self._index = index
+        return index
+
+    def lookup(self, dir_, fname):
+        """path, size, and mtime_ns of fname within the month folder dir_"""
+        folder = os.path.relpath(os.path.normpath(dir_), self.root).split(os.sep)[0]
+        entry = self._lookup(folder, fname)
+        if entry is None or not os.path.exists(entry["path"]):
+            self.refresh()
+            entry = self._lookup(folder, fname)
+        return entry
+
+    def _lookup(self, folder, fname):
+        rel_path = self.index.get((folder, fname))
+        if rel_path is None:
+            return None
+        rel_dir, _ = os.path.split(rel_path)
+        size, mtime_ns = self._dirs[rel_dir]["files"][fname]
+        path = os.path.join(self.root, rel_path)
+        return {"path": path, "size": size, "mtime_ns": mtime_ns}
+
+    def resolve(self, fpath):
+        """
+        fpath if it is there, else the file of the same name found elsewhere
+        in its month folder (None if there isn't one)
+        """
+        if os.path.exists(fpath):
+            return fpath
+        dir_, fname = os.path.split(os.path.normpath(fpath))
+        entry = self.lookup(dir_, fname)
+        return None if entry is None else entry["path"]
+
+
+def _list_dir(dirpath, mtime_ns):
+    files, subdirs = {}, []
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append(entry.name)
+            elif entry.is_file():
+                stat = entry.stat()
+                files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    return {"mtime_ns": mtime_ns, "files": files, "subdirs": sorted(subdirs)}
+
+
+def catalog_for(dir_, catalog_dir):
+    """the catalog of the data root that the month folder dir_ sits in"""
+    return DataCatalog(os.path.dirname(os.path.normpath(dir_)), catalog_dir)
+
+
+if __name__ == "__main__":
+    pass
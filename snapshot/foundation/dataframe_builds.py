@@ -1,38 +1,70 @@
 import numpy as np
 import pandas as pd
+from snapshot.foundation import episodes
 from snapshot.preproccess import clean
+import snapshot.utilities.dates as sud
+import snapshot.utilities.profiling as profiling
 
 
 class MergeAnalysisBase:
+    """
+    The merged served frame is the only frame held. The rp served, intakes,
+    and exits (and any subclass subsets) are kept as row positions into it
+    and are only materialized as DataFrames when asked for.
+    """
+
     def __init__(self, df_dict, rp_start_dt, end_dt):
         self.df_dict = df_dict
         self.rp_start_dt = rp_start_dt
         self.end_dt = end_dt
 
+    @profiling.profiled("merge_floored_base_dfs")
     def merge_floored_base_dfs(
-        self, intake_col, exit_col, ylog_youth_merge_on, intermed_aprogs_merge_on
+        self,
+        intake_col,
+        exit_col,
+        ylog_youth_merge_on,
+        intermed_aprogs_merge_on,
+        prog_name_col=None,
+        intra_program_list=None,
+        columns=None,
     ):
-
-        df = self.df_dict["y_log"].copy()
-        floor_df = clean.floor_dt_columns(df, intake_col, exit_col)
-        intake_constraint = floor_df[intake_col] <= self.end_dt
-        rp_exit_constraint = floor_df[exit_col] >= self.rp_start_dt
-        open_cases = floor_df[exit_col].isna()
-
-        _ylog_rp_served_df = floor_df.loc[
-            (intake_constraint) & (rp_exit_constraint | open_cases), :
-        ].reset_index(drop=True)
-
-        _youth_df = self.df_dict["youth"].copy()
-
-        _a_programs_df = self.df_dict["a_programs"].copy()
-
-        served_df = _ylog_rp_served_df.merge(
-            _youth_df, on=[ylog_youth_merge_on], how="inner"
-        )
-        served_df = served_df.merge(
-            _a_programs_df, on=[intermed_aprogs_merge_on], how="inner"
-        )
+        """
+        Given prog_name_col and intra_program_list the program filter is
+        pushed down ahead of the joins (see plan_served_merge), and columns
+        (what the report reads besides the dates and program name) keeps
+        everything else from being carried through them.
+        """
+        keys = [intake_col, exit_col, ylog_youth_merge_on, intermed_aprogs_merge_on]
+        with profiling.stage("filter programs"):
+            y_log, youth, a_programs = plan_served_merge(
+                self.df_dict,
+                keys=keys,
+                aprogs_merge_on=intermed_aprogs_merge_on,
+                prog_name_col=prog_name_col,
+                intra_program_list=intra_program_list,
+                columns=columns,
+            )
+            profiling.set_rows(len(y_log))
+
+        # flooring copies so the shared y_log is left untouched
+        floor_df = clean.floor_dt_columns(y_log, intake_col, exit_col)
+        with profiling.stage("filter rp"):
+            in_rp = clean.rp_served_constraint(
+                floor_df, intake_col, exit_col, self.rp_start_dt, self.end_dt
+            )
+            _ylog_rp_served_df = floor_df.loc[in_rp, :].reset_index(drop=True)
+            profiling.set_rows(len(_ylog_rp_served_df))
+
+        # merging leaves the inputs untouched so no copies are needed
+        with profiling.stage("merge"):
+            served_df = _ylog_rp_served_df.merge(
+                youth, on=[ylog_youth_merge_on], how="inner"
+            )
+            served_df = served_df.merge(
+                a_programs, on=[intermed_aprogs_merge_on], how="inner"
+            )
+            profiling.set_rows(len(served_df))
 
         self.merged_served_df = served_df
         self.intake_col = intake_col
@@ -40,40 +72,99 @@ class MergeAnalysisBase:
 
         return self
 
+    @profiling.profiled("set_analysis_dfs")
     def set_analysis_dfs(self, prog_name_col, intra_program_list):
         """intake and exit dts are cleaned as returned"""
-
-        merged_served_df = self.merged_served_df.copy()
+        merged_served_df = self.merged_served_df
 
         in_programs = merged_served_df[prog_name_col].isin(intra_program_list)
-        merged_served_prog_df = merged_served_df.loc[in_programs, :].copy()
-
-        self.rp_served_df = merged_served_prog_df
+        self._rp_served_rows = np.flatnonzero(in_programs.values)
+
+        self.episode_index = episodes.EpisodeIndex(
+            episodes.day_ordinals(merged_served_df[self.intake_col])[
+                self._rp_served_rows
+            ],
+            episodes.day_ordinals(merged_served_df[self.exit_col])[
+                self._rp_served_rows
+            ],
+        )
 
-        intakes_in_rp = merged_served_prog_df[self.intake_col] >= self.rp_start_dt
-        self.rp_intakes_df = merged_served_prog_df.loc[intakes_in_rp, :].copy()
+        # index positions are relative to the served rows
+        intakes_in_rp = self.episode_index.intake_positions(
+            self.rp_start_dt, self.end_dt
+        )
+        self._rp_intakes_rows = self._rp_served_rows[intakes_in_rp]
 
-        exits_in_rp = merged_served_prog_df[self.exit_col] <= self.end_dt
-        self.rp_exits_df = merged_served_prog_df.loc[exits_in_rp, :]
+        exits_in_rp = self.episode_index.exit_positions(self.rp_start_dt, self.end_dt)
+        self._rp_exits_rows = self._rp_served_rows[exits_in_rp]
         self.prog_name_col = prog_name_col
+        profiling.set_rows(len(self._rp_served_rows))
 
         return self
 
+    def _select_rows(self, rows, cols=None):
+        """
+        materializes rows of the merged served frame (optionally some cols,
+        a KeyError if one isn't there), taken rather than sliced so callers
+        can add to them without warnings
+        """
+        df = self.merged_served_df
+        if cols is None:
+            return df.take(rows)
+        # projected first so only the columns asked for are copied
+        return df[cols].take(rows)
+
+    @property
+    def rp_served_df(self):
+        return self._select_rows(self._rp_served_rows)
+
+    @property
+    def rp_intakes_df(self):
+        return self._select_rows(self._rp_intakes_rows)
+
+    @property
+    def rp_exits_df(self):
+        return self._select_rows(self._rp_exits_rows)
+
+    def create_period_metrics_df(self, periods):
+        """
+        Served, intakes, exits, month served, and care days per program for
+        every (rp_start_dt, end_dt) in periods, computed in one pass. The
+        periods must fall within this object's report period so set it to
+        cover all of them (e.g. the first start through the last end).
+        """
+        _check_periods_within(periods, self.rp_start_dt, self.end_dt)
+        return period_metrics_build(
+            self._select_rows(
+                self._rp_served_rows,
+                [self.intake_col, self.exit_col, self.prog_name_col],
+            ),
+            self.intake_col,
+            self.exit_col,
+            periods,
+            group_on=self.prog_name_col,
+        )
+
     # only available after the served, intakes, and exits have been called
     @property
     def num_served_rp(self):
-        return len(self.rp_served_df)
+        return len(self._rp_served_rows)
 
     @property
     def num_intakes_rp(self):
-        return len(self.rp_intakes_df)
+        return len(self._rp_intakes_rows)
 
     @property
     def num_exits_rp(self):
-        return len(self.rp_exits_df)
+        return len(self._rp_exits_rows)
 
 
 class AnalysisBase:
+    """
+    Holds the floored rp served frame; intakes, exits, and subclass subsets
+    are row positions into it that are materialized on request.
+    """
+
     def __init__(
         self, prog_df, intake_col_name, exit_col_name, dob_col_name, rp_start_dt, end_dt
     ):
@@ -83,36 +174,54 @@ class AnalysisBase:
         self.rp_start_dt = rp_start_dt
         self.end_dt = end_dt
 
+    @profiling.profiled("set_analysis_dfs")
     def set_analysis_dfs(self):
         self.rp_served_df = self._create_rp_served_df()
-        self.rp_intakes_df = self._create_rp_intakes_df()
-        self.rp_exits_df = self._create_rp_exits_df()
+        self.episode_index = episodes.EpisodeIndex.from_df(
+            self.rp_served_df, self.intake_col_name, self.exit_col_name
+        )
+        self._rp_intakes_rows = self.episode_index.intake_positions(
+            self.rp_start_dt, self.end_dt
+        )
+        self._rp_exits_rows = self.episode_index.exit_positions(
+            self.rp_start_dt, self.end_dt
+        )
+        profiling.set_rows(len(self.rp_served_df))
         return self
 
     def _create_rp_served_df(self):
-        df = self.prog_df.copy()
         _intake_col = self.intake_col_name
         _exit_col = self.exit_col_name
-        floor_df = clean.floor_dt_columns(df, _intake_col, _exit_col)
-        intake_constraint = floor_df[_intake_col] <= self.end_dt
-        rp_exit_constraint = floor_df[_exit_col] >= self.rp_start_dt
-        open_cases = floor_df[_exit_col].isna()
-
-        return_df = floor_df.loc[
-            (intake_constraint) & (rp_exit_constraint | open_cases), :
-        ].reset_index(drop=True)
+        # flooring copies so the input frame is left untouched
+        floor_df = clean.floor_dt_columns(self.prog_df, _intake_col, _exit_col)
+        in_rp = clean.rp_served_constraint(
+            floor_df, _intake_col, _exit_col, self.rp_start_dt, self.end_dt
+        )
+
+        return_df = floor_df.loc[in_rp, :].reset_index(drop=True)
         return return_df
 
-    def _create_rp_intakes_df(self):
-        df = self.rp_served_df.copy()
-        intakes_in_rp = df[self.intake_col_name] >= self.rp_start_dt
-        return df.loc[intakes_in_rp, :]
+    @property
+    def rp_intakes_df(self):
+        return self.rp_served_df.take(self._rp_intakes_rows)
 
-    def _create_rp_exits_df(self):
-        # served already has exit_dt >= rp_start_dt
-        df = self.rp_served_df.copy()
-        exits_in_rp = df[self.exit_col_name] <= self.end_dt
-        return df.loc[exits_in_rp, :]
+    @property
+    def rp_exits_df(self):
+        return self.rp_served_df.take(self._rp_exits_rows)
+
+    def create_period_metrics_df(self, periods, group_on=None):
+        """
+        Same as MergeAnalysisBase.create_period_metrics_df, grouped on
+        group_on (e.g. the subset column) or over the whole program.
+        """
+        _check_periods_within(periods, self.rp_start_dt, self.end_dt)
+        return period_metrics_build(
+            self.rp_served_df,
+            self.intake_col_name,
+            self.exit_col_name,
+            periods,
+            group_on=group_on,
+        )
 
     @property
     def num_served_rp(self):
@@ -120,54 +229,307 @@ class AnalysisBase:
 
     @property
     def num_intakes_rp(self):
-        return len(self.rp_intakes_df)
+        return len(self._rp_intakes_rows)
 
     @property
     def num_exits_rp(self):
-        return len(self.rp_exits_df)
+        return len(self._rp_exits_rows)
+
+
+def plan_served_merge(
+    df_dict,
+    keys,
+    aprogs_merge_on,
+    prog_name_col=None,
+    intra_program_list=None,
+    columns=None,
+):
+    """
+    Cuts y_log, youth, and a_programs down to what the served merge needs.
+    The program names are resolved to their ids so y_log only keeps those
+    programs' episodes (and a_programs only those names, so an id shared
+    with another program's name isn't joined twice). With columns, each
+    table keeps just those plus the keys (dates, merge columns, and the
+    program name). The merge comes out the same as the full one filtered
+    on the program names afterwards.
+    """
+    y_log = df_dict["y_log"]
+    youth = df_dict["youth"]
+    a_programs = df_dict["a_programs"]
+
+    if intra_program_list is not None:
+        in_programs = a_programs[prog_name_col].isin(intra_program_list)
+        a_programs = a_programs.loc[in_programs.values, :]
+        prog_ids = a_programs[aprogs_merge_on]
+        y_log = y_log.loc[y_log[aprogs_merge_on].isin(prog_ids).values, :]
+
+    if columns is not None:
+        keep = set(columns) | set(keys) | {prog_name_col}
+        y_log, youth, a_programs = [
+            df.loc[:, [col for col in df.columns if col in keep]]
+            for df in (y_log, youth, a_programs)
+        ]
+
+    return y_log, youth, a_programs
+
+
+def period_metrics_build(df, intake_col, exit_col, periods, group_on=None):
+    """
+    Tidy period x group table of served, intakes, exits, month served, and
+    care days. df is expected to be floored and already cover every period.
+    """
+    periods = [
+        (start_dt, sud.calc_month_start_from_end_dt(end_dt), end_dt)
+        for start_dt, end_dt in periods
+    ]
+    intake_days = episodes.day_ordinals(df[intake_col])
+    exit_days = episodes.day_ordinals(df[exit_col])
+
+    if group_on is None:
+        codes, groups = None, [None]
+    else:
+        codes, groups = pd.factorize(df[group_on], sort=True)
 
+    metrics = episodes.period_metrics(
+        intake_days, exit_days, periods, codes=codes, n_groups=len(groups)
+    )
+
+    group_cols = [] if group_on is None else [group_on]
+    columns = ["rp_start_dt", "end_dt"] + group_cols + list(metrics)
+    rows = []
+    for j, (start_dt, _, end_dt) in enumerate(periods):
+        for g, group in enumerate(groups):
+            row = [start_dt, end_dt] + ([group] if group_cols else [])
+            rows.append(row + [metrics[m][g, j] for m in metrics])
+    return pd.DataFrame(rows, columns=columns)
 
-def groupby_df_build(_df, group_on, agg_on, agg_func, also_nan=None):
 
-    not_mean_aggfunc = (agg_func == "count") or (agg_func == "sum")
-    mean_aggfunc = agg_func == "mean"
+def _check_periods_within(periods, rp_start_dt, end_dt):
+    for start_dt, period_end_dt in periods:
+        if start_dt < rp_start_dt or period_end_dt > end_dt:
+            raise ValueError(
+                f"Period {start_dt} - {period_end_dt} is outside of the analysis "
+                f"report period {rp_start_dt} - {end_dt}."
+            )
 
+
+def groupby_df_build(_df, group_on, agg_on, agg_func, also_nan=None):
+    return groupby_dfs_build(_df, [group_on], agg_on, agg_func, also_nan)[group_on]
+
+
+@profiling.profiled("groupby")
+def groupby_dfs_build(_df, group_ons, agg_on, agg_func, also_nan=None):
+    """
+    groupby_df_build for several group_on columns in one call (sharing the
+    agg_on work); returns a dict of group_on to its grouped frame. Nothing
+    is copied: each column is factorized to codes and aggregated with
+    bincount, and the TOTAL, percent, and nan rows are laid out in one go.
+    """
+    profiling.set_rows(len(_df))
+    if _df.empty:
+        return {group_on: _empty_groupby_df(agg_func) for group_on in group_ons}
+    _check_agg_func(agg_func)
+
+    agg_series = _df[agg_on]
+    agg_valid = _valid_values(agg_series, also_nan)
+    total_avg = _total_avg(agg_series, agg_valid) if agg_func == "mean" else None
+
+    grouped_dfs = {}
+    for group_on in group_ons:
+        codes, labels = _group_codes(_df[group_on], also_nan)
+        grouped_dfs[group_on] = _grouped_df(
+            group_on, codes, labels, agg_series, agg_valid, agg_func, total_avg
+        )
+    return grouped_dfs
+
+
+@profiling.profiled("groupby")
+def subset_groupby_df_build(
+    _df, subset_col, group_on, agg_on, agg_func, subsets, also_nan=None, all_name="all"
+):
+    """
+    groupby_df_build for each of the subsets labelled in subset_col (plus the
+    whole frame as all_name) with group_on and agg_on cleaned only once.
+    Returns a dict of subset to a frame laid out just as groupby_df_build's.
+    """
+    profiling.set_rows(len(_df))
     if _df.empty:
-        return pd.DataFrame({}, columns=[agg_func, "percent"])
+        return {s: _empty_groupby_df(agg_func) for s in [all_name] + list(subsets)}
+    _check_agg_func(agg_func)
 
-    df = _df.copy()
-    n_total = len(_df)
+    agg_series = _df[agg_on]
+    agg_valid = _valid_values(agg_series, also_nan)
+    codes, labels = _group_codes(_df[group_on], also_nan)
 
-    df_trimmed = df.loc[:, [group_on, agg_on]]
-    if also_nan is not None:
-        df_trimmed = df_trimmed.replace(also_nan, np.nan)
-    grpon_nans = df_trimmed[group_on].isna()
-    n_nans = grpon_nans.sum()
-    df_trimmed_cleaned = df_trimmed.loc[~grpon_nans, :]
+    total_avg = _total_avg(agg_series, agg_valid) if agg_func == "mean" else None
+    subset_dfs = {
+        all_name: _grouped_df(
+            group_on, codes, labels, agg_series, agg_valid, agg_func, total_avg
+        )
+    }
+
+    # each subset's row positions from a single sort of the subset labels
+    subset_codes, subset_labels = pd.factorize(_df[subset_col])
+    by_subset = np.argsort(subset_codes, kind="stable")
+    sorted_codes = subset_codes[by_subset]
+    label_codes = np.arange(len(subset_labels))
+    starts = np.searchsorted(sorted_codes, label_codes, side="left")
+    ends = np.searchsorted(sorted_codes, label_codes, side="right")
+    subset_rows = {
+        label: by_subset[start:end]
+        for label, start, end in zip(subset_labels, starts, ends)
+    }
+
+    for subset in subsets:
+        rows = subset_rows.get(subset)
+        if rows is None:
+            subset_dfs[subset] = _empty_groupby_df(agg_func)
+            continue
+        subset_agg_series = agg_series.iloc[rows]
+        if agg_func == "mean":
+            total_avg = _total_avg(subset_agg_series, agg_valid[rows])
+        group_codes, group_labels = _compact_codes(codes[rows], labels)
+        subset_dfs[subset] = _grouped_df(
+            group_on,
+            group_codes,
+            group_labels,
+            subset_agg_series,
+            agg_valid[rows],
+            agg_func,
+            total_avg,
+        )
+    return subset_dfs
+
+
+def _check_agg_func(agg_func):
+    if agg_func not in ["count", "sum", "mean"]:
+        raise ValueError('Only "count", "sum", & "mean" available')
 
-    df_grouped = df_trimmed_cleaned.groupby(group_on).agg(agg_func)
-    df_grouped.columns = [agg_func]
 
-    if not_mean_aggfunc:
-        df_grouped.loc["TOTAL", agg_func] = df_grouped[agg_func].sum()
+def _empty_groupby_df(agg_func):
+    return pd.DataFrame({}, columns=[agg_func, "percent"])
 
-    elif mean_aggfunc:
-        df_grouped.loc["TOTAL_AVG", agg_func] = df_trimmed[agg_on].mean()
-        df_grouped["mean"] = df_grouped["mean"].round(2)
+
+def _also_nan_list(also_nan):
+    return [also_nan] if isinstance(also_nan, str) else list(also_nan)
+
+
+def _valid_values(series, also_nan):
+    """not nan (nor one of the also_nan stand-ins for a text column)"""
+    valid = series.notna().values
+    is_text = pd.api.types.is_object_dtype(series) or isinstance(
+        series.dtype, pd.CategoricalDtype
+    )
+    if also_nan is not None and is_text:
+        valid &= ~series.isin(_also_nan_list(also_nan)).values
+    return valid
+
+
+def _total_avg(agg_series, agg_valid):
+    # only subset when needed so the mean is summed exactly as a groupby's
+    return agg_series.mean() if agg_valid.all() else agg_series[agg_valid].mean()
+
+
+def _group_codes(group_series, also_nan):
+    """
+    Codes into the sorted group labels with -1 for nan and also_nan values.
+    Categoricals use their existing codes so only the categories are
+    looked at (unused categories are left out, as in an observed groupby).
+    """
+    if isinstance(group_series.dtype, pd.CategoricalDtype):
+        codes = group_series.cat.codes.values.astype(np.int64)
+        uniques = group_series.cat.categories
     else:
-        raise ValueError('Only "count", "sum", & "mean" available')
+        codes, uniques = pd.factorize(group_series)
+    # the extra last slot keeps -1 (nan) as -1
+    order = uniques.argsort()
+    remap = np.full(len(uniques) + 1, -1, dtype=np.int64)
+    remap[order] = np.arange(len(uniques))
+    if also_nan is not None:
+        remap[:-1][uniques.isin(_also_nan_list(also_nan))] = -1
+    return _compact_codes(remap[codes], uniques[order])
+
+
+def _compact_codes(codes, labels):
+    """drops the labels no row uses, keeping the rest in order"""
+    used = np.bincount(codes[codes >= 0], minlength=len(labels)) > 0
+    if used.all():
+        return codes, labels
+    remap = np.append(np.cumsum(used) - 1, -1)
+    return remap[codes], labels[used]
+
+
+def _grouped_values(codes, agg_series, agg_valid, agg_func, n_groups):
+    """agg_func of the agg values per code (every code is in use)"""
+    if agg_func == "count":
+        return np.bincount(codes[agg_valid], minlength=n_groups)
+
+    values = agg_series.values
+    if values.dtype.kind in "iu":
+        sums = np.bincount(codes, weights=values, minlength=n_groups)
+        if agg_func == "sum":
+            return sums.astype(np.int64)
+        return sums / np.bincount(codes, minlength=n_groups)
+    # floats go through pandas so the sums are compensated just as a groupby's
+    return pd.Series(values).groupby(codes).agg(agg_func).values.astype(np.float64)
+
+
+def _grouped_df(group_on, codes, labels, agg_series, agg_valid, agg_func, total_avg):
+    """
+    The grouped frame with its TOTAL (or TOTAL_AVG) and nan rows; adding
+    either row makes the aggregate column float and the nan row's count
+    goes in a "count" column for sums and means. A group already labelled
+    TOTAL or nan has that row filled in rather than a second one added (as
+    setting them by label always has).
+    """
+    in_group = codes >= 0
+    n_total = len(codes)
+    n_nans = np.int64(n_total - np.count_nonzero(in_group))
+    if in_group.all():
+        grouped = _grouped_values(codes, agg_series, agg_valid, agg_func, len(labels))
+    else:
+        rows = np.flatnonzero(in_group)
+        grouped = _grouped_values(
+            codes[rows], agg_series.iloc[rows], agg_valid[rows], agg_func, len(labels)
+        )
 
-    if agg_func in ["count", "sum"]:
-        df_grouped["percent"] = (
-            df_grouped[agg_func] / df_grouped.loc["TOTAL", agg_func] * 100
-        ).round(2)
+    row_labels = list(labels)
+    total_label = "TOTAL_AVG" if agg_func == "mean" else "TOTAL"
+    total = total_avg if agg_func == "mean" else pd.Series(grouped).sum()
+    total_row = _row_position(row_labels, total_label)
+    agg_values = np.append(grouped, np.nan) if total_row == len(grouped) else grouped
+    agg_values[total_row] = total
+
+    if agg_func == "mean":
+        agg_values = np.round(agg_values, 2)
+        percents = np.full(len(agg_values), np.nan)
+    else:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            percents = np.round(agg_values / agg_values[total_row] * 100, 2)
+
+    nan_row = _row_position(row_labels, "nan")
+    if nan_row == len(agg_values):
+        agg_values = np.append(agg_values, np.nan)
+        percents = np.append(percents, np.nan)
+    percents[nan_row] = round(n_nans / n_total * 100.0, 2)
+
+    columns = {agg_func: agg_values, "percent": percents}
+    if agg_func == "count":
+        agg_values[nan_row] = n_nans
     else:
-        df_grouped["percent"] = np.nan
+        counts = np.full(len(agg_values), np.nan)
+        counts[nan_row] = n_nans
+        columns["count"] = counts
+
+    index = pd.Index(row_labels, dtype=object, name=group_on)
+    return pd.DataFrame(columns, index=index)
 
-    df_grouped.loc["nan", "count"] = n_nans
-    df_grouped.loc["nan", "percent"] = round(n_nans / n_total * 100.0, 2)
 
-    return df_grouped
+def _row_position(row_labels, label):
+    """position of label in row_labels, adding it to the end if missing"""
+    if label not in row_labels:
+        row_labels.append(label)
+    return row_labels.index(label)
 
 
 if __name__ == "__main__":
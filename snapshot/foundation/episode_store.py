@@ -0,0 +1,240 @@
+import glob
+import hashlib
+import io
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+# the columns that identify an episode in each table (rows sharing them are
+# kept, as the csv path keeps them, only counted)
+TABLE_KEYS = {
+    "y_log": ["youth_id", "prog_id", "intake_dt"],
+    "youth": ["youth_id"],
+    "a_programs": ["prog_id"],
+}
+
+_LINE_HASH_COL = "_line_hash"
+
+
+class EpisodeStore:
+    """
+    A local copy of y_log, youth, and a_programs kept up to date from the
+    monthly extracts. Each extract is a full fresh dump, so rather than
+    re-parsing it all every month the raw lines are hashed and only the
+    lines not already in the latest stored table are parsed. The table
+    holds the same rows as the extract in the same order: rows whose lines
+    are gone are dropped (an edited episode is a new line), and repeated
+    lines and rows sharing a key (see TABLE_KEYS) are kept as read_csv
+    keeps them.
+
+    Tables are kept per extract file (so per month folder), each with its
+    own manifest, so reading one month never returns another's rows and
+    processes sharing the store only ever replace whole files.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        self._tables = {}
+
+    def _base_path(self, name, fpath):
+        source_key = hashlib.sha1(os.path.abspath(fpath).encode("utf-8"))
+        return os.path.join(self.store_dir, f"{name}-{source_key.hexdigest()[:16]}")
+
+    def _read_manifest(self, manifest_path):
+        try:
+            with open(manifest_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest_path, manifest):
+        tmp_path = f"{manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+    def ingest(self, name, fpath, cols, parse_dates):
+        """
+        Upserts the rows of the extract at fpath into its table. Returns a
+        dict of how many rows were added, dropped, and share a key with an
+        earlier row (nothing is read if the file is unchanged since ingested).
+        """
+        base_path = self._base_path(name, fpath)
+        stat = os.stat(fpath)
+        source = {
+            "path": os.path.abspath(fpath),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "cols": cols,
+        }
+        manifest = self._read_manifest(f"{base_path}.json")
+        if manifest.get("source") == source and os.path.exists(f"{base_path}.pkl"):
+            return {"added": 0, "dropped": 0, "duplicate_keys": 0}
+
+        with open(fpath, "rb") as f:
+            header, *lines = f.read().splitlines()
+        lines = np.array([line for line in lines if line.strip()], dtype=object)
+        table, counts = None, None
+        if not _has_multiline_fields(lines):
+            table, counts = self._upsert(name, fpath, header, lines, cols, parse_dates)
+        if table is None:
+            # a quoted newline splits a row over lines, so lines aren't rows
+            table, counts = _full_parse(name, fpath, cols, parse_dates)
+
+        self._store_table(f"{base_path}.pkl", table)
+        self._write_manifest(
+            f"{base_path}.json", {"source": source, "rows": len(table)}
+        )
+        return counts
+
+    def _upsert(self, name, fpath, header, lines, cols, parse_dates):
+        """the extract's rows, those of lines already stored taken from there"""
+        line_hashes = pd.util.hash_array(lines)
+
+        stored = self._latest_table(name, fpath, cols)
+        if stored is None:
+            stored_hashes = np.array([], dtype=np.uint64)
+        else:
+            stored_hashes = stored[_LINE_HASH_COL].values
+
+        # the stored row of each line, if any (repeated lines are identical)
+        unique_hashes, first_row = np.unique(stored_hashes, return_index=True)
+        at = np.searchsorted(unique_hashes, line_hashes)
+        is_stored = np.zeros(len(lines), dtype=bool)
+        in_range = at < len(unique_hashes)
+        is_stored[in_range] = unique_hashes[at[in_range]] == line_hashes[in_range]
+        is_new = ~is_stored
+
+        new_rows = _parse_lines(header, lines[is_new], cols, parse_dates)
+        if len(new_rows) != is_new.sum():
+            return None, None
+        new_rows[_LINE_HASH_COL] = line_hashes[is_new]
+
+        if stored is None:
+            table = new_rows
+        else:
+            kept_rows = stored.take(first_row[at[is_stored]])
+            table = pd.concat([kept_rows, new_rows], ignore_index=True)
+            # back in extract order
+            line_order = np.concatenate(
+                [np.flatnonzero(is_stored), np.flatnonzero(is_new)]
+            )
+            table = table.take(np.argsort(line_order, kind="stable"))
+            table = table.reset_index(drop=True)
+        for col in parse_dates:
+            table[col] = pd.to_datetime(table[col])
+        return table, {
+            "added": int(is_new.sum()),
+            "dropped": int((~np.isin(stored_hashes, line_hashes)).sum()),
+            "duplicate_keys": int(table.duplicated(TABLE_KEYS[name]).sum()),
+        }
+
+    def _latest_table(self, name, fpath, cols):
+        """
+        The table to upsert onto: this extract's own if there is one, else
+        the one of name ingested last (usually the month before). None if
+        there isn't one with the same columns.
+        """
+        own_path = f"{self._base_path(name, fpath)}.pkl"
+        candidates = glob.glob(
+            os.path.join(glob.escape(self.store_dir), f"{name}-*.pkl")
+        )
+        candidates = [path for path in candidates if path != own_path]
+        candidates.sort(key=_mtime_ns, reverse=True)
+        for table_path in [own_path] + candidates:
+            try:
+                table = self._load_table(table_path)
+            except Exception:
+                # one being replaced or half written, try the next
+                continue
+            if table is not None and set(table.columns) == set(cols) | {_LINE_HASH_COL}:
+                return table
+        return None
+
+    def _load_table(self, table_path):
+        if table_path not in self._tables:
+            if not os.path.exists(table_path):
+                return None
+            self._tables[table_path] = pd.read_pickle(table_path)
+        return self._tables[table_path]
+
+    def _store_table(self, table_path, table):
+        tmp_path = f"{table_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        table.to_pickle(tmp_path)
+        os.replace(tmp_path, table_path)
+        self._tables[table_path] = table
+
+    def get_df(self, name, fpath, categoricals=None):
+        """the table ingested from the extract at fpath"""
+        table = self._load_table(f"{self._base_path(name, fpath)}.pkl")
+        if table is None:
+            raise FileNotFoundError(f"{fpath} has not been ingested for {name} yet.")
+        df = table.drop(columns=[_LINE_HASH_COL])
+        for col in categoricals or []:
+            df[col] = df[col].astype("category")
+        df.name = name
+        return df
+
+    def get_name_df_dictionary(self, fpaths, categoricals=None):
+        """
+        same layout as VTrimRead.get_name_df_dictionary, fpaths maps each
+        table to the extract it was ingested from
+        """
+        categoricals = {} if categoricals is None else categoricals
+        return {
+            name: self.get_df(name, fpaths[name], categoricals.get(name))
+            for name in TABLE_KEYS
+        }
+
+
+def _mtime_ns(fpath):
+    try:
+        return os.stat(fpath).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _has_multiline_fields(lines):
+    """
+    whether a quoted field runs over a line break, i.e. a line has an odd
+    number of quotes (escaped quotes come in pairs)
+    """
+    return any(line.count(b'"') % 2 for line in lines if b'"' in line)
+
+
+def _full_parse(name, fpath, cols, parse_dates):
+    """the table from a plain read of the whole extract, rows hashed by value"""
+    table = pd.read_csv(
+        fpath,
+        header=0,
+        usecols=cols,
+        parse_dates=parse_dates,
+        infer_datetime_format=True,
+    )
+    for col in parse_dates:
+        table[col] = pd.to_datetime(table[col])
+    # these never match a line's hash so the next ingest starts over too
+    table[_LINE_HASH_COL] = pd.util.hash_pandas_object(table, index=False).values
+    return table, {
+        "added": len(table),
+        "dropped": 0,
+        "duplicate_keys": int(table.duplicated(TABLE_KEYS[name]).sum()),
+    }
+
+
+def _parse_lines(header, lines, cols, parse_dates):
+    text = b"\n".join([header] + list(lines))
+    return pd.read_csv(
+        io.BytesIO(text),
+        header=0,
+        usecols=cols,
+        parse_dates=parse_dates,
+        infer_datetime_format=True,
+    )
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+
+# open cases (no exit date) exit here; a missing intake here is never served
+FAR_FUTURE_DAY = np.iinfo(np.int32).max
+
+# keeps the n x periods work matrices to a reasonable size
+_PERIOD_BLOCK_ROWS = 100_000
+
+
+def day_ordinals(dt_series, fill=FAR_FUTURE_DAY):
+    """days since the epoch as int32; missing dates become fill"""
+    days = dt_series.values.astype("datetime64[D]").astype(np.int64)
+    days[dt_series.isna().values] = fill
+    return days.astype(np.int32)
+
+
+def whole_years(birth_dts, reference_dts):
+    """
+    Exact age in completed years on each reference date, worked out from
+    the years, months, and days (a Feb 29 birthday comes on Mar 1 in other
+    years). float64 so that a missing date is NaN.
+    """
+    # differs from dateutil's relativedelta on purpose: it counts a Feb 29
+    # birthday as reached on Feb 28 of other years, here it is on Mar 1
+    birth_years, birth_month_days = _year_month_day(birth_dts)
+    ref_years, ref_month_days = _year_month_day(reference_dts)
+    ages = (ref_years - birth_years - (ref_month_days < birth_month_days)).astype(
+        np.float64
+    )
+    ages[birth_dts.isna().values | reference_dts.isna().values] = np.nan
+    return ages
+
+
+def _year_month_day(dt_series):
+    """the year, and the month and day as one comparable number"""
+    days = dt_series.values.astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+    years = days.astype("datetime64[Y]")
+    month = months.astype(np.int64) - years.astype("datetime64[M]").astype(np.int64)
+    day = (days - months.astype("datetime64[D]")).astype(np.int64)
+    return years.astype(np.int64) + 1970, month * 32 + day
+
+
+def start_day(start_dt):
+    """first whole day on/after the start (episode dates are floored)"""
+    return int(np.datetime64(pd.Timestamp(start_dt).ceil("D"), "D").astype(np.int64))
+
+
+def end_day(end_dt):
+    return int(np.datetime64(pd.Timestamp(end_dt).floor("D"), "D").astype(np.int64))
+
+
+class EpisodeIndex:
+    """
+    Intake and exit days sorted once so that served, intakes, and exits in
+    any [start, end] window are answered with binary searches. Counts cost
+    O(log n); row positions come back in their original (ascending) order.
+
+    Episodes with an exit before their intake would throw off the sorted
+    arithmetic so those few rows are kept aside and checked directly.
+    """
+
+    def __init__(self, intake_days, exit_days):
+        self.intake_days = intake_days
+        self.exit_days = exit_days
+        self._intake_order = np.argsort(intake_days, kind="stable")
+        self._exit_order = np.argsort(exit_days, kind="stable")
+        self._sorted_intakes = intake_days[self._intake_order]
+        self._sorted_exits = exit_days[self._exit_order]
+        self._inverted = np.flatnonzero(exit_days < intake_days)
+
+    @classmethod
+    def from_df(cls, df, intake_col, exit_col):
+        return cls(day_ordinals(df[intake_col]), day_ordinals(df[exit_col]))
+
+    def __len__(self):
+        return len(self.intake_days)
+
+    def count_served(self, start_dt, end_dt):
+        """in on/before the end and out on/after the start (or open)"""
+        start, end = start_day(start_dt), end_day(end_dt)
+        n_in_by_end = np.searchsorted(self._sorted_intakes, end, side="right")
+        n_out_before_start = np.searchsorted(self._sorted_exits, start, side="left")
+        # out before the start yet in after the end is only possible if inverted
+        inv = self._inverted
+        n_inverted = np.count_nonzero(
+            (self.exit_days[inv] < start) & (self.intake_days[inv] > end)
+        )
+        return int(n_in_by_end - n_out_before_start + n_inverted)
+
+    def count_intakes(self, start_dt, end_dt):
+        """served in the window with an intake on/after the start"""
+        start, end = start_day(start_dt), end_day(end_dt)
+        lo = np.searchsorted(self._sorted_intakes, start, side="left")
+        hi = np.searchsorted(self._sorted_intakes, end, side="right")
+        inv = self._inverted
+        n_inverted = np.count_nonzero(
+            (self.intake_days[inv] >= start)
+            & (self.intake_days[inv] <= end)
+            & (self.exit_days[inv] < start)
+        )
+        return int(hi - lo - n_inverted)
+
+    def count_exits(self, start_dt, end_dt):
+        """served in the window with an exit on/before the end"""
+        start, end = start_day(start_dt), end_day(end_dt)
+        lo = np.searchsorted(self._sorted_exits, start, side="left")
+        hi = np.searchsorted(self._sorted_exits, end, side="right")
+        inv = self._inverted
+        n_inverted = np.count_nonzero(
+            (self.exit_days[inv] >= start)
+            & (self.exit_days[inv] <= end)
+            & (self.intake_days[inv] > end)
+        )
+        return int(hi - lo - n_inverted)
+
+    def served_positions(self, start_dt, end_dt):
+        start, end = start_day(start_dt), end_day(end_dt)
+        hi = np.searchsorted(self._sorted_intakes, end, side="right")
+        candidates = self._intake_order[:hi]
+        return np.sort(candidates[self.exit_days[candidates] >= start])
+
+    def intake_positions(self, start_dt, end_dt):
+        start, end = start_day(start_dt), end_day(end_dt)
+        lo = np.searchsorted(self._sorted_intakes, start, side="left")
+        hi = np.searchsorted(self._sorted_intakes, end, side="right")
+        candidates = self._intake_order[lo:hi]
+        return np.sort(candidates[self.exit_days[candidates] >= start])
+
+    def exit_positions(self, start_dt, end_dt):
+        start, end = start_day(start_dt), end_day(end_dt)
+        lo = np.searchsorted(self._sorted_exits, start, side="left")
+        hi = np.searchsorted(self._sorted_exits, end, side="right")
+        candidates = self._exit_order[lo:hi]
+        return np.sort(candidates[self.intake_days[candidates] <= end])
+
+
+def episode_care_days(intake_days, exit_days, start_dt, end_dt):
+    """
+    Days of care within [start, end] per episode, counting both the first
+    and last day. Open cases run through the end; episodes outside the
+    window get 0.
+    """
+    start, end = start_day(start_dt), end_day(end_dt)
+    days = np.minimum(exit_days, end) - np.maximum(intake_days, start) + 1
+    return np.clip(days, 0, None, out=days)
+
+
+def care_days(intake_days, exit_days, start_dt, end_dt, codes=None, n_groups=1):
+    """total care days as an int, or an int per group if codes are given"""
+    days = episode_care_days(intake_days, exit_days, start_dt, end_dt)
+    if codes is None:
+        return int(days.sum(dtype=np.int64))
+    keep = codes >= 0
+    totals = np.bincount(codes[keep], weights=days[keep], minlength=n_groups)
+    return [int(t) for t in totals]
+
+
+def length_of_stay(intake_days, exit_days):
+    """days from intake to exit per episode (only meaningful for exits)"""
+    return exit_days - intake_days
+
+
+def period_metrics(intake_days, exit_days, periods, codes=None, n_groups=1):
+    """
+    Counts served, intakes, exits, and month served plus care days for every
+    period in one vectorized pass. periods is a list of
+    (rp_start_dt, month_start_dt, end_dt) and codes (optional) places each
+    episode in a group. Returns a dict of (n_groups x n_periods) arrays.
+    """
+    starts = np.array([start_day(p[0]) for p in periods], dtype=np.int64)
+    month_starts = np.array([start_day(p[1]) for p in periods], dtype=np.int64)
+    ends = np.array([end_day(p[2]) for p in periods], dtype=np.int64)
+
+    if codes is None:
+        codes = np.zeros(len(intake_days), dtype=np.int64)
+
+    metrics = ("served", "intakes", "exits", "month_served", "care_days")
+    out = {m: np.zeros((n_groups, len(periods)), dtype=np.int64) for m in metrics}
+
+    for lo in range(0, len(intake_days), _PERIOD_BLOCK_ROWS):
+        hi = lo + _PERIOD_BLOCK_ROWS
+        intake = intake_days[lo:hi, None]
+        exit_ = exit_days[lo:hi, None]
+        block_codes = codes[lo:hi]
+        keep = block_codes >= 0  # missing groups are dropped like a groupby
+
+        served = (intake <= ends) & (exit_ >= starts)
+        care = np.minimum(exit_, ends) - np.maximum(intake, starts) + 1
+        block = {
+            "served": served,
+            "intakes": served & (intake >= starts),
+            "exits": served & (exit_ <= ends),
+            "month_served": served & (exit_ >= month_starts),
+            "care_days": np.clip(care, 0, None, out=care),
+        }
+        for m in metrics:
+            values = block[m][keep]
+            for j in range(len(periods)):
+                out[m][:, j] += np.bincount(
+                    block_codes[keep], weights=values[:, j], minlength=n_groups
+                ).astype(np.int64)
+
+    return out
+
+
+if __name__ == "__main__":
+    pass
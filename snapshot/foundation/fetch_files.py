@@ -1,98 +1,416 @@
-from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache, partial
 import os
 import pandas as pd
+from snapshot.foundation.catalog import catalog_for
+from snapshot.foundation.episode_store import EpisodeStore
+from snapshot.foundation.frame_cache import FrameCache, freeze_args
+from snapshot.preproccess import clean
+import snapshot.utilities.profiling as profiling
+
+# the columns read from each v/w extract and the dates parsed in them
+VTRIM_COLUMNS = {
+    "y_log": (
+        ["intake_dt", "exit_dt", "prog_id", "youth_id", "discharge"],
+        ["intake_dt", "exit_dt"],
+    ),
+    "youth": (["youth_id", "gender", "race", "ethnic", "birth_dt"], ["birth_dt"]),
+    "a_programs": (["prog_name", "prog_id"], False),
+}
 
 
 class VTrimRead:
-    def __init__(self, fn_ylog, fn_youth, fn_a_programs, dir_):
+    def __init__(
+        self,
+        fn_ylog,
+        fn_youth,
+        fn_a_programs,
+        dir_,
+        frame_cache_dir=None,
+        chunksize=None,
+        categoricals=None,
+        catalog=None,
+        load_workers=None,
+    ):
+        """
+        categoricals maps youth/a_programs to the columns to load as such;
+        a DataCatalog (catalog) resolves the file paths without walking;
+        load_workers > 1 reads the three extracts side by side on threads
+        """
         self.fn_ylog = fn_ylog
         self.fn_youth = fn_youth
         self.fn_a_programs = fn_a_programs
         self.dir = dir_
+        self.frame_cache = (
+            None if frame_cache_dir is None else FrameCache(frame_cache_dir)
+        )
+        self.chunksize = chunksize
+        self.categoricals = {} if categoricals is None else categoricals
+        self.catalog = catalog
+        self.load_workers = load_workers
 
     @property
     def fp_ylog(self):
-        return os.path.join(self.dir, "v", "w", self.fn_ylog)
+        return self._resolve(os.path.join(self.dir, "v", "w", self.fn_ylog))
 
     @property
     def fp_youth(self):
-        return os.path.join(self.dir, "v", "w", self.fn_youth)
+        return self._resolve(os.path.join(self.dir, "v", "w", self.fn_youth))
 
     @property
     def fp_a_programs(self):
-        return os.path.join(self.dir, "v", "w", self.fn_a_programs)
+        return self._resolve(os.path.join(self.dir, "v", "w", self.fn_a_programs))
+
+    def _resolve(self, fpath):
+        if self.catalog is None:
+            return fpath
+        # a file missing from the catalog falls through to the search
+        resolved = self.catalog.resolve(fpath)
+        return fpath if resolved is None else resolved
 
-    def get_name_df_dictionary(self):
-        y_log = self._get_y_log()
-        youth = self._get_youth()
-        a_programs = self._get_a_programs()
+    def get_name_df_dictionary(self, rp_start_dt=None, end_dt=None):
+        """
+        When a chunksize is set and the report period is given, y_log is
+        streamed and only the episodes served in the period are kept.
+        """
+        if self.chunksize is not None and rp_start_dt is not None:
+            get_y_log = partial(self._get_rp_y_log, rp_start_dt, end_dt)
+        else:
+            get_y_log = self._get_y_log
+        y_log, youth, a_programs = _load_all(
+            [get_y_log, self._get_youth, self._get_a_programs], self.load_workers
+        )
         return {y_log.name: y_log, youth.name: youth, a_programs.name: a_programs}
 
+    def ingest_into(self, episode_store):
+        """
+        upserts this folder's extracts into an EpisodeStore, returns the
+        table name -> extract path to read them back with
+        """
+        fpaths = {
+            "y_log": _locate(self.fp_ylog, self.dir),
+            "youth": _locate(self.fp_youth, self.dir),
+            "a_programs": _locate(self.fp_a_programs, self.dir),
+        }
+        for name, fpath in fpaths.items():
+            cols, parse_dates = VTRIM_COLUMNS[name]
+            episode_store.ingest(name, fpath, cols, parse_dates if parse_dates else [])
+        return fpaths
+
     @lru_cache(maxsize=None)
     def _get_y_log(self):
-        cols = ["intake_dt", "exit_dt", "prog_id", "youth_id", "discharge"]
-        parse_dates = ["intake_dt", "exit_dt"]
+        cols, parse_dates = VTRIM_COLUMNS["y_log"]
         df = _fetch_csv(
-            self.fp_ylog, cols, parse_dates, infer_dt=True, search_in=self.dir
+            self.fp_ylog,
+            cols,
+            parse_dates,
+            infer_dt=True,
+            search_in=self.dir,
+            frame_cache=self.frame_cache,
+        )
+        df.name = "y_log"
+        return df
+
+    @lru_cache(maxsize=None)
+    def _get_rp_y_log(self, rp_start_dt, end_dt):
+        cols, parse_dates = VTRIM_COLUMNS["y_log"]
+
+        def keep_served_in_rp(chunk):
+            # a chunk of all-blank dates is not parsed so force the dtype
+            for col in parse_dates:
+                chunk[col] = pd.to_datetime(chunk[col])
+            floor_chunk = clean.floor_dt_columns(chunk, *parse_dates)
+            in_rp = clean.rp_served_constraint(
+                floor_chunk, "intake_dt", "exit_dt", rp_start_dt, end_dt
+            )
+            return floor_chunk.loc[in_rp, :]
+
+        df = _fetch_csv(
+            self.fp_ylog,
+            cols,
+            parse_dates,
+            infer_dt=True,
+            search_in=self.dir,
+            chunksize=self.chunksize,
+            keep=keep_served_in_rp,
         )
         df.name = "y_log"
         return df
 
     @lru_cache(maxsize=None)
     def _get_youth(self):
-        cols = ["youth_id", "gender", "race", "ethnic", "birth_dt"]
-        parse_dates = ["birth_dt"]
+        cols, parse_dates = VTRIM_COLUMNS["youth"]
         df = _fetch_csv(
-            self.fp_youth, cols, parse_dates, infer_dt=True, search_in=self.dir
+            self.fp_youth,
+            cols,
+            parse_dates,
+            infer_dt=True,
+            search_in=self.dir,
+            frame_cache=self.frame_cache,
+            categoricals=self.categoricals.get("youth"),
         )
         df.name = "youth"
         return df
 
     @lru_cache(maxsize=None)
     def _get_a_programs(self):
-        cols = ["prog_name", "prog_id"]
+        cols, parse_dates = VTRIM_COLUMNS["a_programs"]
         df = _fetch_csv(
             self.fp_a_programs,
             cols,
-            parse_dates=False,
+            parse_dates=parse_dates,
             infer_dt=False,
             search_in=self.dir,
+            frame_cache=self.frame_cache,
+            categoricals=self.categoricals.get("a_programs"),
         )
         df.name = "a_programs"
         return df
 
 
 class ExcelRead:
-    def __init__(self, filename, dir_, skiprows, parse_dates, cols=None):
+    def __init__(
+        self,
+        filename,
+        dir_,
+        skiprows,
+        parse_dates,
+        cols=None,
+        frame_cache_dir=None,
+        categoricals=None,
+        catalog=None,
+    ):
         self.filename = filename
         self.dir = dir_
         self.skiprows = skiprows
         self.parse_dates = parse_dates
         self.cols = cols
+        self.categoricals = categoricals
+        self.catalog = catalog
+        self.frame_cache = (
+            None if frame_cache_dir is None else FrameCache(frame_cache_dir)
+        )
 
     @property
     def filepath(self):
-        return os.path.join(self.dir, self.filename)
+        fpath = os.path.join(self.dir, self.filename)
+        if self.catalog is None:
+            return fpath
+        resolved = self.catalog.resolve(fpath)
+        return fpath if resolved is None else resolved
 
     def fetch_excel(self):
-        return pd.read_excel(
-            self.filepath,
+        read_args = dict(
             header=0,
             skiprows=self.skiprows,
             usecols=self.cols,
             parse_dates=self.parse_dates,
+            categoricals=self.categoricals,
+        )
+        with profiling.stage(f"load {self.filename}"):
+            if self.frame_cache is None:
+                df = _read_excel(self.filepath, **read_args)
+            else:
+                # the workbook's fingerprint is part of the key so edits invalidate it
+                df = self.frame_cache.fetch(self.filepath, _read_excel, **read_args)
+            profiling.set_rows(len(df))
+        return df
+
+
+class LoadSession:
+    """
+    Hands out the same readers (and so the same parsed frames) to every
+    report run within a session. Keyed on the files being read, so reports
+    that point at the same month folder or workbook share one parse.
+
+    With an episode_store_dir the v/w extracts are upserted into an
+    EpisodeStore and read back from it instead of from the csvs. With a
+    catalog_dir the files are found through a DataCatalog of each data root.
+    load_workers > 1 reads a month's extracts on that many threads and lets
+    workbooks be prefetched (see prefetch_excel) while other work runs.
+    """
+
+    def __init__(
+        self,
+        frame_cache_dir=None,
+        chunksize=None,
+        categoricals=None,
+        episode_store_dir=None,
+        catalog_dir=None,
+        load_workers=None,
+    ):
+        self.frame_cache_dir = frame_cache_dir
+        self.catalog_dir = catalog_dir
+        self._catalogs = {}
+        self.chunksize = chunksize
+        self.categoricals = categoricals
+        self.episode_store = (
+            None if episode_store_dir is None else EpisodeStore(episode_store_dir)
+        )
+        self._vtrim_readers = {}
+        self._excel_dfs = {}
+        self.load_workers = load_workers
+        self._pool = None
+
+    @classmethod
+    def from_config(cls, **overrides):
+        """builds a session with the options set in config.yml (or overrides)"""
+        from snapshot.config import app_config
+
+        options = dict(
+            frame_cache_dir=app_config.frame_cache_dir,
+            chunksize=app_config.y_log_chunksize,
+            categoricals=app_config.categorical_columns,
+            episode_store_dir=app_config.episode_store_dir,
+            catalog_dir=app_config.catalog_dir,
+            load_workers=app_config.load_workers,
+        )
+        options.update(overrides)
+        return cls(**options)
+
+    def catalog(self, dir_):
+        """the (shared) catalog of the data root the month folder dir_ is in"""
+        if self.catalog_dir is None:
+            return None
+        root = os.path.dirname(os.path.normpath(dir_))
+        if root not in self._catalogs:
+            self._catalogs[root] = catalog_for(dir_, self.catalog_dir)
+        return self._catalogs[root]
+
+    def vtrim_read(self, fn_ylog, fn_youth, fn_a_programs, dir_):
+        key = (fn_ylog, fn_youth, fn_a_programs, os.path.normpath(dir_))
+        if key not in self._vtrim_readers:
+            self._vtrim_readers[key] = VTrimRead(
+                fn_ylog=fn_ylog,
+                fn_youth=fn_youth,
+                fn_a_programs=fn_a_programs,
+                dir_=dir_,
+                frame_cache_dir=self.frame_cache_dir,
+                chunksize=self.chunksize,
+                categoricals=self.categoricals,
+                catalog=self.catalog(dir_),
+                load_workers=self.load_workers,
+            )
+        return self._vtrim_readers[key]
+
+    def get_name_df_dictionary(
+        self, fn_ylog, fn_youth, fn_a_programs, dir_, rp_start_dt=None, end_dt=None
+    ):
+        vtr = self.vtrim_read(fn_ylog, fn_youth, fn_a_programs, dir_)
+        if self.episode_store is None:
+            return vtr.get_name_df_dictionary(rp_start_dt=rp_start_dt, end_dt=end_dt)
+
+        # an unchanged extract is only stat'd, its table was stored when first seen
+        with profiling.stage("ingest"):
+            fpaths = vtr.ingest_into(self.episode_store)
+        with profiling.stage("load episode store"):
+            df_dict = self.episode_store.get_name_df_dictionary(
+                fpaths, self.categoricals
+            )
+            profiling.set_rows(len(df_dict["y_log"]))
+        return df_dict
+
+    def fetch_excel(
+        self, filename, dir_, skiprows, parse_dates, cols=None, categoricals=None
+    ):
+        key = _excel_key(filename, dir_, skiprows, parse_dates, cols, categoricals)
+        if key not in self._excel_dfs:
+            self._excel_dfs[key] = self._excel_read(
+                filename, dir_, skiprows, parse_dates, cols, categoricals
+            ).fetch_excel()
+        elif isinstance(self._excel_dfs[key], Future):
+            self._excel_dfs[key] = self._excel_dfs[key].result()
+        return self._excel_dfs[key]
+
+    def prefetch_excel(
+        self, filename, dir_, skiprows, parse_dates, cols=None, categoricals=None
+    ):
+        """
+        Starts reading a workbook on the session's threads, a later
+        fetch_excel with the same arguments waits for it. Does nothing
+        without load_workers (or if the workbook is already read).
+        """
+        if not self.load_workers or self.load_workers < 2:
+            return
+        key = _excel_key(filename, dir_, skiprows, parse_dates, cols, categoricals)
+        if key in self._excel_dfs:
+            return
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.load_workers, thread_name_prefix="prefetch"
+            )
+        excel_read = self._excel_read(
+            filename, dir_, skiprows, parse_dates, cols, categoricals
+        )
+        self._excel_dfs[key] = self._pool.submit(
+            profiling.carried(excel_read.fetch_excel)
         )
 
+    def _excel_read(self, filename, dir_, skiprows, parse_dates, cols, categoricals):
+        return ExcelRead(
+            filename=filename,
+            dir_=dir_,
+            skiprows=skiprows,
+            parse_dates=parse_dates,
+            cols=cols,
+            frame_cache_dir=self.frame_cache_dir,
+            categoricals=categoricals,
+            catalog=self.catalog(dir_),
+        )
+
+
+def _excel_key(filename, dir_, skiprows, parse_dates, cols, categoricals):
+    return (
+        os.path.normpath(os.path.join(dir_, filename)),
+        freeze_args(skiprows),
+        freeze_args(parse_dates),
+        freeze_args(cols),
+        freeze_args(categoricals),
+    )
 
-def _fetch_csv(fpath, cols, parse_dates, infer_dt, search_in):
+
+def _load_all(loaders, workers):
+    """
+    The results of the no argument loaders, in order. With more than one
+    worker they run on a thread pool; the reads are mostly waiting on the
+    drive or in the C parser (which lets go of the GIL), so they overlap.
+    """
+    if not workers or workers < 2:
+        return [load() for load in loaders]
+    with ThreadPoolExecutor(
+        max_workers=min(workers, len(loaders)), thread_name_prefix="load"
+    ) as pool:
+        futures = [pool.submit(profiling.carried(load)) for load in loaders]
+        return [future.result() for future in futures]
+
+
+def _fetch_csv(
+    fpath,
+    cols,
+    parse_dates,
+    infer_dt,
+    search_in,
+    frame_cache=None,
+    chunksize=None,
+    keep=None,
+    categoricals=None,
+):
+    """
+    If a chunksize is given the file is read in chunks and keep (a function
+    from chunk to the rows to hold on to) is applied to each one, so only the
+    kept rows are ever held in memory together. Streamed reads skip the cache.
+    """
     in_expected_loc = os.path.exists(fpath)
     if in_expected_loc:
-        df = pd.read_csv(
+        df = _read_csv(
             fpath,
-            header=0,
-            usecols=cols,
-            parse_dates=parse_dates,
-            infer_datetime_format=infer_dt,
+            cols,
+            parse_dates,
+            infer_dt,
+            frame_cache,
+            chunksize,
+            keep,
+            categoricals,
         )
 
     else:
@@ -103,12 +421,15 @@ def _fetch_csv(fpath, cols, parse_dates, infer_dt, search_in):
                 f"Could not locate file in {search_in} or subdirectories."
             )
         try:
-            df = pd.read_csv(
+            df = _read_csv(
                 new_fp,
-                header=0,
-                usecols=cols,
-                parse_dates=parse_dates,
-                infer_datetime_format=infer_dt,
+                cols,
+                parse_dates,
+                infer_dt,
+                frame_cache,
+                chunksize,
+                keep,
+                categoricals,
             )
         except Exception as e:
             raise ValueError(f"Error in building DF: {e}")
@@ -116,9 +437,75 @@ def _fetch_csv(fpath, cols, parse_dates, infer_dt, search_in):
     return df
 
 
+def _read_csv(
+    fpath,
+    cols,
+    parse_dates,
+    infer_dt,
+    frame_cache=None,
+    chunksize=None,
+    keep=None,
+    categoricals=None,
+):
+    with profiling.stage(f"load {os.path.basename(fpath)}"):
+        df = _parse_csv(
+            fpath,
+            cols,
+            parse_dates,
+            infer_dt,
+            frame_cache,
+            chunksize,
+            keep,
+            categoricals,
+        )
+        profiling.set_rows(len(df))
+    return df
+
+
+def _parse_csv(
+    fpath, cols, parse_dates, infer_dt, frame_cache, chunksize, keep, categoricals
+):
+    read_args = dict(
+        header=0, usecols=cols, parse_dates=parse_dates, infer_datetime_format=infer_dt
+    )
+    if categoricals:
+        read_args["dtype"] = {col: "category" for col in categoricals}
+    if chunksize is not None:
+        kept = [
+            keep(chunk)
+            for chunk in pd.read_csv(fpath, chunksize=chunksize, **read_args)
+        ]
+        if not kept:
+            return keep(pd.read_csv(fpath, nrows=0, **read_args))
+        return pd.concat(kept, ignore_index=True)
+    if frame_cache is None:
+        return pd.read_csv(fpath, **read_args)
+    return frame_cache.fetch(fpath, pd.read_csv, **read_args)
+
+
+def _read_excel(fpath, categoricals=None, **read_args):
+    df = pd.read_excel(fpath, **read_args)
+    for col in categoricals or []:
+        df[col] = df[col].astype("category")
+    return df
+
+
+def _locate(fpath, search_in):
+    if os.path.exists(fpath):
+        return fpath
+    new_fp = _file_search(search_in, os.path.basename(fpath))
+    if new_fp is None:
+        raise FileNotFoundError(
+            f"Could not locate file in {search_in} or subdirectories."
+        )
+    return new_fp
+
+
 def _file_search(search_in, fname):
     for dirpath, _, filenames in os.walk(search_in, topdown=True):
-        return os.path.join(dirpath, fname) if fname in filenames else None
+        if fname in filenames:
+            return os.path.join(dirpath, fname)
+    return None
 
 
 if __name__ == "__main__":
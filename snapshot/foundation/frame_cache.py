@@ -0,0 +1,103 @@
+import hashlib
+import os
+import threading
+import pandas as pd
+
+
+class FrameCache:
+    """
+    On-disk cache of parsed DataFrames. Entries are keyed by the content of
+    the source file (size, mtime, and hash) plus the arguments used to read
+    it, so a changed file or a different set of columns is a miss.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def fetch(self, fpath, read_func, **read_args):
+        """returns the cached frame for fpath or reads and caches it"""
+        key = self.key(fpath, **read_args)
+        df = self.load(key)
+        if df is None:
+            df = read_func(fpath, **read_args)
+            self.store(key, df)
+        return df
+
+    def key(self, fpath, **read_args):
+        args = sorted((k, freeze_args(v)) for k, v in read_args.items())
+        raw = repr((file_fingerprint(fpath, self.cache_dir), args))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def load(self, key):
+        fpath = self._entry_path(key)
+        if not os.path.exists(fpath):
+            return None
+        try:
+            return pd.read_pickle(fpath)
+        except Exception:
+            # a partial or stale entry just falls back to a fresh read
+            return None
+
+    def store(self, key, df):
+        fpath = self._entry_path(key)
+        tmp_fpath = f"{fpath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_pickle(tmp_fpath)
+        os.replace(tmp_fpath, fpath)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+
+def file_fingerprint(fpath, memo_dir=None):
+    """
+    (size, mtime, sha1) of a file. When memo_dir is given the hash is
+    remembered against size and mtime so an unchanged file is not re-read.
+    """
+    stat = os.stat(fpath)
+    size_mtime = (stat.st_size, stat.st_mtime_ns)
+
+    memo_fpath = None
+    if memo_dir is not None:
+        path_key = hashlib.sha1(os.path.abspath(fpath).encode("utf-8")).hexdigest()
+        memo_fpath = os.path.join(memo_dir, f"{path_key}.fp")
+        memo = _read_memo(memo_fpath)
+        if memo is not None and memo[:2] == size_mtime:
+            return memo
+
+    sha = hashlib.sha1()
+    with open(fpath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    digest = sha.hexdigest()
+
+    if memo_fpath is not None:
+        # replaced whole so a reader never sees a half written memo
+        tmp_fpath = f"{memo_fpath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_fpath, "w") as f:
+            f.write(f"{size_mtime[0]} {size_mtime[1]} {digest}")
+        os.replace(tmp_fpath, memo_fpath)
+    return size_mtime + (digest,)
+
+
+def _read_memo(memo_fpath):
+    """the memo's (size, mtime, sha1), None if missing or unreadable (a miss)"""
+    try:
+        with open(memo_fpath, "r") as f:
+            size, mtime, digest = f.read().split()
+        return int(size), int(mtime), digest
+    except (OSError, ValueError):
+        return None
+
+
+def freeze_args(arg):
+    """lists and dicts from the config are made hashable as tuples"""
+    if isinstance(arg, (list, tuple)):
+        return tuple(freeze_args(a) for a in arg)
+    if isinstance(arg, dict):
+        return tuple(sorted((k, freeze_args(v)) for k, v in arg.items()))
+    return arg
+
+
+if __name__ == "__main__":
+    pass
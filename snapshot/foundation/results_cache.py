@@ -0,0 +1,177 @@
+import functools
+import hashlib
+import json
+import os
+import pickle
+from snapshot.config import app_config
+import snapshot.utilities.dates as sud
+
+_PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the performance options that change what the reports load (the rest only
+# change how fast)
+_OUTPUT_OPTIONS = ("episode_store_dir", "categorical_columns")
+
+
+class ResultsCache:
+    """
+    On-disk cache of report results (pickled response dicts). Once the
+    entries add up to more than max_bytes the least recently used ones are
+    evicted; a hit counts as a use.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.result")
+
+    def get(self, key):
+        fpath = self._entry_path(key)
+        if not os.path.exists(fpath):
+            return None
+        try:
+            with open(fpath, "rb") as f:
+                result = pickle.load(f)
+        except Exception:
+            # a partial or stale entry just means running the report again
+            return None
+        os.utime(fpath)
+        return result
+
+    def put(self, key, result):
+        fpath = self._entry_path(key)
+        tmp_fpath = f"{fpath}.{os.getpid()}.tmp"
+        with open(tmp_fpath, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fpath, fpath)
+        self.evict()
+
+    def evict(self):
+        """drops the least recently used entries until under max_bytes"""
+        entries = []
+        with os.scandir(self.cache_dir) as dir_entries:
+            for entry in dir_entries:
+                if entry.name.endswith(".result"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, fpath in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(fpath)
+            except OSError:
+                pass
+            total -= size
+
+
+def report_key(name, input_files, config_sections, start_dt, end_dt, production):
+    """
+    None if an input file can't be found (the report then just runs), else
+    a hash of the inputs' fingerprints, the config sections the report
+    reads, the performance options that change its frames, the dates, and
+    the package's source files
+    """
+    from snapshot.foundation.frame_cache import file_fingerprint
+
+    fingerprints = []
+    for fpath in input_files:
+        if not os.path.exists(fpath):
+            return None
+        memo_dir = app_config.results_cache_dir
+        fingerprints.append((fpath, file_fingerprint(fpath, memo_dir)))
+    sections = {section: app_config.config[section] for section in config_sections}
+    options = {option: getattr(app_config, option) for option in _OUTPUT_OPTIONS}
+    raw = repr(
+        (
+            name,
+            fingerprints,
+            json.dumps(sections, sort_keys=True, default=str),
+            json.dumps(options, sort_keys=True, default=str),
+            str(start_dt),
+            str(end_dt),
+            production,
+            _code_fingerprint(),
+        )
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _code_fingerprint():
+    """editing the package invalidates the results computed by the old code"""
+    stats = []
+    for dirpath, _, filenames in os.walk(_PACKAGE_DIR):
+        for fname in sorted(filenames):
+            if fname.endswith(".py"):
+                stat = os.stat(os.path.join(dirpath, fname))
+                stats.append((fname, stat.st_size, stat.st_mtime_ns))
+    return hashlib.sha1(repr(sorted(stats)).encode("utf-8")).hexdigest()
+
+
+def cached_report(config_sections, input_files):
+    """
+    Memoizes a report function (start_dt, end_dt, production, ...) when
+    performance.results_cache_dir is set. input_files is a function of
+    (end_dt, production) to the files the report reads. Both are kept on
+    the wrapper so run_all can combine them.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(start_dt, end_dt, production, *args, **kwargs):
+            if app_config.results_cache_dir is None:
+                return func(start_dt, end_dt, production, *args, **kwargs)
+
+            cache = ResultsCache(
+                app_config.results_cache_dir,
+                app_config.results_cache_max_mb * 1024 * 1024,
+            )
+            key = report_key(
+                func.__name__,
+                input_files(end_dt, production),
+                config_sections,
+                start_dt,
+                end_dt,
+                production,
+            )
+            result = None if key is None else cache.get(key)
+            if result is None:
+                result = func(start_dt, end_dt, production, *args, **kwargs)
+                if key is not None:
+                    cache.put(key, result)
+            return result
+
+        wrapper.config_sections = config_sections
+        wrapper.input_files = input_files
+        return wrapper
+
+    return decorator
+
+
+def _month_dir(end_dt, production):
+    root = app_config.production_root if production else app_config.dev_root
+    return os.path.join(root, sud.end_dt_to_folder(end_dt=end_dt))
+
+
+def network_input_files(end_dt, production):
+    month_dir = _month_dir(end_dt, production)
+    return [
+        os.path.join(month_dir, "v", "w", fname)
+        for fname in (app_config.fn_ylog, app_config.fn_youth, app_config.fn_a_programs)
+    ]
+
+
+def tlp_input_files(end_dt, production):
+    return [os.path.join(_month_dir(end_dt, production), app_config.tlp_filename)]
+
+
+def jac_input_files(end_dt, production):
+    return [os.path.join(_month_dir(end_dt, production), app_config.jac_filename)]
+
+
+if __name__ == "__main__":
+    pass
@@ -1,7 +1,9 @@
 import pandas as pd
 from snapshot.config import app_config
+import snapshot.utilities.profiling as profiling
 
 
+@profiling.profiled("floor")
 def floor_dt_columns(df, *args):
     if df.empty:
         return df
@@ -11,6 +13,14 @@ def floor_dt_columns(df, *args):
     return flr_df
 
 
+def rp_served_constraint(floor_df, intake_col, exit_col, rp_start_dt, end_dt):
+    """intake on/before the end and exit on/after the rp start (or still open)"""
+    intake_constraint = floor_df[intake_col] <= end_dt
+    rp_exit_constraint = floor_df[exit_col] >= rp_start_dt
+    open_cases = floor_df[exit_col].isna()
+    return (intake_constraint) & (rp_exit_constraint | open_cases)
+
+
 def clean_gender_column(df, gender_column):
     if df.empty:
         return df
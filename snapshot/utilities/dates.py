@@ -1,7 +1,6 @@
 import calendar
 from dateutil.relativedelta import relativedelta
 import datetime
-import pandas as pd
 from snapshot.config import app_config
 
 
@@ -18,9 +17,31 @@ def calculate_fy_end_dt(fy_start_dt):
 
 
 def calc_month_start_from_end_dt(end_dt):
+    import pandas as pd
+
     return pd.Timestamp(year=end_dt.year, month=end_dt.month, day=1)
 
 
+def fy_to_date_periods(fy_start_dt, num_months=12):
+    """(fy start, month end) for each month, i.e. the periods of the monthly reports"""
+    import pandas as pd
+
+    fy_start = pd.Timestamp(fy_start_dt)
+    periods = []
+    for i in range(num_months):
+        month_start = fy_start + relativedelta(months=+i)
+        month_end = month_start + pd.offsets.MonthEnd(0)
+        periods.append((fy_start, month_end))
+    return periods
+
+
+def to_timestamp(date_str):
+    """argparse type for the report dates (pandas is only loaded once parsing one)"""
+    import pandas as pd
+
+    return pd.Timestamp(date_str)
+
+
 def end_dt_to_folder(end_dt):
     """if the naming convention ever changes this will need to be updated"""
     month_name = app_config.month_map[end_dt.month]["name"]
@@ -28,6 +49,31 @@ def end_dt_to_folder(end_dt):
     return f"{month_name} {year}"
 
 
+def folder_to_end_dt(folder):
+    """the month end a "Month YYYY" folder is for (None if it isn't one)"""
+    import pandas as pd
+
+    try:
+        month_name, year = folder.rsplit(" ", 1)
+        year = int(year)
+    except ValueError:
+        return None
+    for month, names in app_config.month_map.items():
+        if names["name"] == month_name:
+            month_start = pd.Timestamp(year=year, month=int(month), day=1)
+            return month_start + pd.offsets.MonthEnd(0)
+    return None
+
+
+def fy_start_for(end_dt):
+    """the start of the fiscal year end_dt falls in (by expected_fy_start)"""
+    import pandas as pd
+
+    fy_start = app_config.exp_fy_start
+    start = pd.Timestamp(year=end_dt.year, month=fy_start["month"], day=fy_start["day"])
+    return start if start <= end_dt else start - pd.DateOffset(years=1)
+
+
 if __name__ == "__main__":
     d1 = datetime.date(2019, 8, 31)
     d2 = datetime.date(2020, 6, 30)
@@ -0,0 +1,438 @@
+import contextlib
+import functools
+import gc
+import json
+import sys
+import threading
+import time
+import tracemalloc
+
+# the profile being recorded, None when profiling is off (the default), in
+# which case stages are a check of this and nothing else
+_active = None
+
+_MB = 1024**2
+
+
+class Profile:
+    """
+    Wall time, calls, and rows per stage. Stages nest, each is recorded
+    under the path of the stages it ran within (e.g. shelter/load ylog.csv)
+    and repeat calls of a path add up. rows is what the stage worked on,
+    the rows it read, kept, or grouped (None where that doesn't apply).
+
+    With memory=True each stage also gets (via tracemalloc) the bytes it
+    left allocated and its peak above what was allocated when it started,
+    the process's peak resident memory so far, and the largest DataFrames
+    alive as it finished (by memory_usage(deep=True)). That accounting is
+    slow, the times taken with it are only good relative to each other.
+
+    Each thread has its own stack of open stages (see carried). Stages that
+    run side by side all count their wall time, and their memory is traced
+    for the whole process, so it is shared out between them loosely.
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._records = {}
+        self._start = time.perf_counter()
+        self.total_seconds = None
+        if memory:
+            tracemalloc.start()
+
+    @property
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def _enter(self, stage):
+        if self.memory:
+            self._fold_peak()
+            stage._mem_start = stage._mem_peak = tracemalloc.get_traced_memory()[0]
+        self._stack.append(stage)
+        path = "/".join(s.name for s in self._stack)
+        # recorded on the way in so parents are listed before their stages
+        with self._lock:
+            self._records.setdefault(path, _new_record(path, self.memory))
+        return path
+
+    def _exit(self, stage, seconds):
+        with self._lock:
+            self._exit_record(stage, seconds)
+
+    def _exit_record(self, stage, seconds):
+        record = self._records[stage._path]
+        if self.memory:
+            self._fold_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            record["alloc_mb"] += (current - stage._mem_start) / _MB
+            peak_mb = (stage._mem_peak - stage._mem_start) / _MB
+            record["peak_mb"] = max(record["peak_mb"], peak_mb)
+            record["peak_rss_mb"] = _peak_rss_mb()
+            frames = largest_frames()
+            if _frames_mb(frames) >= _frames_mb(record["largest_frames"]):
+                record["largest_frames"] = frames
+            # the frame scan's own allocations aren't the stages'
+            _reset_peak()
+        self._stack.pop()
+        record["calls"] += 1
+        record["seconds"] += seconds
+        if stage.rows is not None:
+            record["rows"] = (record["rows"] or 0) + int(stage.rows)
+
+    def _fold_peak(self):
+        """carries the traced peak since the last reset into the open stages"""
+        peak = tracemalloc.get_traced_memory()[1]
+        for open_stage in self._stack:
+            open_stage._mem_peak = max(open_stage._mem_peak, peak)
+        _reset_peak()
+
+    def finish(self):
+        self.total_seconds = time.perf_counter() - self._start
+        if self.memory:
+            tracemalloc.stop()
+        return self
+
+    def records(self):
+        return [dict(record) for record in self._ordered()]
+
+    def _ordered(self):
+        """the records in the order first seen, each stage under its parent"""
+        children = {}
+        for path in self._records:
+            children.setdefault(path.rpartition("/")[0], []).append(path)
+        ordered = []
+
+        def add(parent):
+            for path in children.get(parent, []):
+                ordered.append(self._records[path])
+                add(path)
+
+        add("")
+        return ordered
+
+    def add_records(self, records):
+        """adds the records of a profile taken elsewhere (e.g. a worker)"""
+        for record in records:
+            path = record["stage"]
+            mine = self._records.setdefault(path, _new_record(path, self.memory))
+            mine["calls"] += record["calls"]
+            mine["seconds"] += record["seconds"]
+            if record["rows"] is not None:
+                mine["rows"] = (mine["rows"] or 0) + record["rows"]
+            if self.memory and "alloc_mb" in record:
+                mine["alloc_mb"] += record["alloc_mb"]
+                mine["peak_mb"] = max(mine["peak_mb"], record["peak_mb"])
+                mine["peak_rss_mb"] = max(
+                    mine["peak_rss_mb"] or 0, record["peak_rss_mb"] or 0
+                )
+                if _frames_mb(record["largest_frames"]) >= _frames_mb(
+                    mine["largest_frames"]
+                ):
+                    mine["largest_frames"] = record["largest_frames"]
+
+    def to_dict(self):
+        return {"total_seconds": self.total_seconds, "stages": self.records()}
+
+    def write_json(self, fpath):
+        with open(fpath, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+    def _stage_names(self, records):
+        return [
+            "  " * record["stage"].count("/") + record["stage"].rsplit("/", 1)[-1]
+            for record in records
+        ]
+
+    def format(self):
+        """the stages as an indented table, share is of the total wall time"""
+        total = self.total_seconds or sum(
+            r["seconds"] for r in self._records.values() if "/" not in r["stage"]
+        )
+        records = self._ordered()
+        names = self._stage_names(records)
+        width = max([len("stage")] + [len(name) for name in names])
+        lines = [
+            f"{'stage':<{width}} {'calls':>6} {'seconds':>9} {'share':>7} {'rows':>12}"
+        ]
+        for name, record in zip(names, records):
+            share = 100 * record["seconds"] / total if total else 0.0
+            count = "" if record["rows"] is None else f"{record['rows']:,}"
+            lines.append(
+                f"{name:<{width}} {record['calls']:>6} {record['seconds']:>9.3f} "
+                f"{share:>6.1f}% {count:>12}"
+            )
+        lines.append(f"{'total':<{width}} {'':>6} {total:>9.3f}")
+        return "\n".join(lines)
+
+    def format_memory(self, top=5):
+        """
+        Memory per stage in MB, then the largest live frames as each of the
+        top stages (by peak) finished. alloc is what the stage left allocated,
+        peak its high point above its start, and peak rss the process's.
+        """
+        records = self._ordered()
+        names = self._stage_names(records)
+        width = max([len("stage")] + [len(name) for name in names])
+        lines = [f"{'stage':<{width}} {'alloc':>9} {'peak':>9} {'peak rss':>9}"]
+        for name, record in zip(names, records):
+            rss = record["peak_rss_mb"]
+            lines.append(
+                f"{name:<{width}} {record['alloc_mb']:>9.1f} {record['peak_mb']:>9.1f} "
+                f"{'' if rss is None else f'{rss:.1f}':>9}"
+            )
+
+        by_peak = sorted(
+            self._records.values(), key=lambda r: r["peak_mb"], reverse=True
+        )
+        for record in by_peak[:top]:
+            lines.append(f"\nlargest live frames after {record['stage']}:")
+            for frame in record["largest_frames"]:
+                name = "" if frame["name"] is None else f"  {frame['name']}"
+                lines.append(
+                    f"  {frame['mb']:>9.1f} MB  {frame['rows']:,} x {frame['cols']}"
+                    f"{name}  [{', '.join(frame['columns'])}]"
+                )
+        return "\n".join(lines)
+
+
+def _new_record(path, memory):
+    record = {"stage": path, "calls": 0, "seconds": 0.0, "rows": None}
+    if memory:
+        record.update(
+            {"alloc_mb": 0.0, "peak_mb": 0.0, "peak_rss_mb": None, "largest_frames": []}
+        )
+    return record
+
+
+class _Stage:
+    __slots__ = ("name", "rows", "_path", "_start", "_mem_start", "_mem_peak")
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+
+    def __enter__(self):
+        self._path = _active._enter(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _active._exit(self, time.perf_counter() - self._start)
+        return False
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """context manager timing the block as a stage (a no-op when off)"""
+    if _active is None:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def profiled(name):
+    """
+    Decorator timing each call as a stage. Its rows are the rows of the
+    result (if it is a frame or array) unless the function calls set_rows.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with _Stage(name) as current:
+                result = func(*args, **kwargs)
+                if current.rows is None:
+                    current.rows = _result_rows(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def set_rows(rows):
+    """sets the row count of the stage currently running (a no-op when off)"""
+    if _active is not None and _active._stack:
+        _active._stack[-1].rows = rows
+
+
+def carried(func):
+    """
+    func wrapped so that, run on another thread, its stages are recorded
+    under the stages open where it was wrapped (func itself when off)
+    """
+    if _active is None:
+        return func
+    profile, parent = _active, list(_active._stack)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile._local.stack = list(parent)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile._local.stack = []
+
+    return wrapper
+
+
+def _result_rows(result):
+    shape = getattr(result, "shape", None)
+    return shape[0] if shape else None
+
+
+def largest_frames(n=5):
+    """the n largest DataFrames alive (deep sizes, so strings count)"""
+    import pandas as pd
+
+    frames = [obj for obj in gc.get_objects() if isinstance(obj, pd.DataFrame)]
+    # shallow sizes narrow it down, only the candidates get the slow deep size
+    frames.sort(key=lambda df: df.memory_usage(deep=False).sum(), reverse=True)
+    sized = [(df.memory_usage(deep=True).sum(), df) for df in frames[: 2 * n]]
+    sized.sort(key=lambda pair: pair[0], reverse=True)
+    return [
+        {
+            "name": vars(df).get("name"),
+            "rows": df.shape[0],
+            "cols": df.shape[1],
+            "columns": [str(col) for col in df.columns[:6]],
+            "mb": round(nbytes / _MB, 2),
+        }
+        for nbytes, df in sized[:n]
+    ]
+
+
+def _frames_mb(frames):
+    return sum(frame["mb"] for frame in frames)
+
+
+def _reset_peak():
+    # before python 3.9 the peak can't be reset, stage peaks then overstate
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+
+
+def _peak_rss_mb():
+    """the process's peak resident memory (None where it can't be read)"""
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_rss_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / _MB if sys.platform == "darwin" else peak / 1024
+
+
+def _windows_peak_rss_mb():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    try:
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ok = ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(),
+            ctypes.byref(counters),
+            counters.cb,
+        )
+    except (AttributeError, OSError):
+        return None
+    return counters.PeakWorkingSetSize / _MB if ok else None
+
+
+def is_enabled():
+    return _active is not None
+
+
+def options():
+    """what start was called with, None when off (to start one elsewhere)"""
+    return None if _active is None else {"memory": _active.memory}
+
+
+def start(memory=False):
+    global _active
+    _active = Profile(memory=memory)
+    return _active
+
+
+def stop():
+    global _active
+    profile, _active = _active, None
+    return None if profile is None else profile.finish()
+
+
+def add_records(records):
+    if _active is not None and records:
+        _active.add_records(records)
+
+
+def add_arguments(parser, name):
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print the time and rows of each stage of the run",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="also account for the memory of each stage and the largest frames "
+        "(slow, implies --profile)",
+    )
+    parser.add_argument(
+        "--profile-json",
+        default=f"{name}-profile.json",
+        help=f"where --profile writes the stages (default: {name}-profile.json)",
+    )
+
+
+@contextlib.contextmanager
+def cli_profile(args):
+    """profiles the block when --profile (or --memory) was given"""
+    if not (args.profile or args.memory):
+        yield None
+        return
+    profile = start(memory=args.memory)
+    try:
+        yield profile
+    finally:
+        stop()
+    print("\n" + profile.format())
+    if profile.memory:
+        print("\n" + profile.format_memory())
+    profile.write_json(args.profile_json)
+    print(f"\nprofile written to {args.profile_json}")
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,276 @@
+import os
+import numpy as np
+import pandas as pd
+from snapshot.config import app_config
+import snapshot.utilities.dates as sud
+
+# mean length of stay in days for each kind of program
+_MEAN_LOS_DAYS = {"shelter": 14, "nonres": 90, "snap": 60, "other": 30}
+# share of episodes in each kind of program
+_PROGRAM_WEIGHTS = {"shelter": 0.35, "nonres": 0.3, "snap": 0.1, "other": 0.25}
+_OTHER_PROGRAM_NAMES = ["OTHER PROGRAM 1", "OTHER PROGRAM 2", "OTHER PROGRAM 3"]
+
+# messy on purpose, the cleaning steps should see what the real entries look like
+_GENDERS = ["Male", "Female", "male", "female", "M", "F", "Transgender", "Unknown"]
+_TLP_RACES = ["White", "black", "Black", "Multi", "na", "~"]
+_JAC_RACES = ["White", "Black", "Multi", "na", "nan", "~"]
+_REFERRAL_SOURCES = ["School", "Parent", "Police", "Self", "Court"]
+_EXIT_TYPES = ["Successful", "successful", "Unsuccessful", "Neutral"]
+_DISCHARGES = ["Home", "Relative", "Foster", "Runaway", "Other"]
+
+_CSV_CHUNK_ROWS = 1_000_000
+_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def write_month(root, end_dt, n_episodes, roster_rows=None, history_years=5, seed=0):
+    """
+    Writes a month folder of fake data under root laid out the way the
+    reports expect (the v/w csvs plus the TLP and JAC workbooks) using the
+    file and column names in config.yml. y_log gets n_episodes rows going
+    back history_years from end_dt; the rosters default to a size that
+    grows with it. Returns the month folder.
+    """
+    _check_presets()
+    end_dt = pd.Timestamp(end_dt)
+    if roster_rows is None:
+        roster_rows = int(min(max(n_episodes // 1000, 50), 20_000))
+    rng = np.random.default_rng(seed)
+    month_dir = os.path.join(root, sud.end_dt_to_folder(end_dt=end_dt))
+    vw_dir = os.path.join(month_dir, "v", "w")
+    os.makedirs(vw_dir, exist_ok=True)
+
+    a_programs, program_kinds = a_programs_df()
+    youth = youth_df(rng, max(n_episodes // 3, 1), end_dt, history_years)
+    y_log = y_log_df(
+        rng,
+        n_episodes,
+        youth[app_config.youth_id_column].values,
+        a_programs[app_config.program_id_column].values,
+        program_kinds,
+        end_dt,
+        history_years,
+    )
+
+    _write_csv(y_log, os.path.join(vw_dir, app_config.fn_ylog))
+    _write_csv(youth, os.path.join(vw_dir, app_config.fn_youth))
+    _write_csv(a_programs, os.path.join(vw_dir, app_config.fn_a_programs))
+    _write_tlp(
+        tlp_df(rng, roster_rows, end_dt),
+        os.path.join(month_dir, app_config.tlp_filename),
+    )
+    jac_df(rng, roster_rows, end_dt).to_excel(
+        os.path.join(month_dir, app_config.jac_filename), index=False
+    )
+    return month_dir
+
+
+def a_programs_df():
+    """the programs named in config.yml plus a few the reports should ignore"""
+    names, kinds = [], []
+    for kind, program_names in (
+        ("shelter", app_config.shelter_program_names),
+        ("nonres", app_config.nonres_program_names),
+        ("snap", app_config.snap_program_names),
+        ("other", _OTHER_PROGRAM_NAMES),
+    ):
+        names.extend(sorted(program_names))
+        kinds.extend([kind] * len(program_names))
+    df = pd.DataFrame(
+        {
+            app_config.program_name_column: names,
+            app_config.program_id_column: np.arange(100, 100 + len(names)),
+        }
+    )
+    return df, np.array(kinds)
+
+
+def youth_df(rng, n_youth, end_dt, history_years):
+    race_codes = app_config.demo_codes["race"]["known"] + ["Z"]
+    hispanic = app_config.demo_codes["ethnicity"]["Hispanic"]
+    # old enough to be served somewhere in the history, young enough to be youth
+    oldest = end_dt - pd.DateOffset(years=history_years + 18)
+    birth_dts = _random_dates(rng, oldest, end_dt - pd.DateOffset(years=8), n_youth)
+    return pd.DataFrame(
+        {
+            app_config.youth_id_column: rng.permutation(n_youth) + 1_000_000,
+            app_config.gender_column: _with_missing(rng, _GENDERS, n_youth),
+            app_config.race_column: _with_missing(rng, race_codes, n_youth),
+            app_config.ethnic_column: _with_missing(rng, [hispanic, "N"], n_youth),
+            app_config.birth_dt_column: birth_dts.floor("D"),
+        }
+    )
+
+
+def y_log_df(rng, n, youth_ids, prog_ids, program_kinds, end_dt, history_years):
+    """
+    Episodes sorted by intake. Stays that would run past end_dt are left
+    open, the same as they'd be in the extract.
+    """
+    kind_weights = np.array([_PROGRAM_WEIGHTS[kind] for kind in program_kinds])
+    kind_counts = pd.Series(program_kinds).map(pd.Series(program_kinds).value_counts())
+    program_idx = rng.choice(len(prog_ids), n, p=_normalized(kind_weights, kind_counts))
+    mean_los = np.array([_MEAN_LOS_DAYS[kind] for kind in program_kinds])[program_idx]
+
+    start = end_dt - pd.DateOffset(years=history_years)
+    intake_dts = _random_dates(rng, start, end_dt, n, with_time=True).sort_values()
+    los = pd.to_timedelta(rng.exponential(mean_los) * 86400, unit="s")
+    exit_dts = pd.Series(intake_dts + los)
+    exit_dts[exit_dts > end_dt] = pd.NaT
+
+    # about three episodes per youth, spread over different programs
+    youth_idx = rng.integers(0, len(youth_ids), n)
+    return pd.DataFrame(
+        {
+            app_config.intake_dt_column: intake_dts.values,
+            app_config.exit_dt_column: exit_dts.values,
+            app_config.program_id_column: prog_ids[program_idx],
+            app_config.youth_id_column: youth_ids[youth_idx],
+            "discharge": rng.choice(_DISCHARGES, n),
+        }
+    )
+
+
+def tlp_df(rng, n, end_dt):
+    """the TLP roster, stays run months rather than days"""
+    intake_dts = _random_dates(rng, end_dt - pd.DateOffset(years=2), end_dt, n)
+    los = pd.to_timedelta(rng.exponential(150, n).round(), unit="D")
+    exit_dts = pd.Series(intake_dts + los)
+    exit_dts[exit_dts > end_dt] = pd.NaT
+    birth_dts = _random_dates(
+        rng, end_dt - pd.DateOffset(years=23), end_dt - pd.DateOffset(years=17), n
+    )
+    return pd.DataFrame(
+        {
+            app_config.tlp_intake_dt_column: intake_dts.floor("D"),
+            app_config.tlp_exit_dt_column: exit_dts.values,
+            app_config.tlp_birth_dt_column: birth_dts.floor("D"),
+            app_config.tlp_gender_column: _with_missing(rng, _GENDERS, n),
+            app_config.tlp_race_column: _with_missing(rng, _TLP_RACES, n),
+            app_config.tlp_subset_column: rng.choice(app_config.tlp_subsets, n),
+            "Type of exit": rng.choice(_EXIT_TYPES, n),
+        }
+    )
+
+
+def jac_df(rng, n, end_dt):
+    """the JAC roster, about a third of the ids are marked cc"""
+    served_dts = _random_dates(rng, end_dt - pd.DateOffset(years=1), end_dt, n)
+    birth_dts = _random_dates(
+        rng, end_dt - pd.DateOffset(years=19), end_dt - pd.DateOffset(years=6), n
+    )
+    is_cc = rng.random(n) < 0.3
+    ids = pd.Series(np.arange(n) + 10_000).astype(str)
+    ids[is_cc] = ids[is_cc] + rng.choice(["cc", "CC"], int(is_cc.sum()))
+    df = pd.DataFrame(
+        {
+            app_config.jac_served_dt_column: served_dts.floor("D"),
+            app_config.jac_birth_dt_column: birth_dts.floor("D"),
+            app_config.jac_id_column: ids.values,
+            app_config.jac_referral_source_column: rng.choice(_REFERRAL_SOURCES, n),
+            app_config.jac_gender_column: _with_missing(rng, _GENDERS, n),
+            app_config.jac_race_column: _with_missing(rng, _JAC_RACES, n),
+        }
+    )
+    if app_config.jac_pre_calc_age_column is not None:
+        age = (served_dts - birth_dts) / pd.to_timedelta("365 days")
+        df[app_config.jac_pre_calc_age_column] = age.values.round(1)
+    return df
+
+
+def _check_presets():
+    sections = {
+        "network_data_presets": app_config.ntwk_presets,
+        "tlp": {"filename": app_config.tlp_filename, **app_config.tlp_presets},
+        "jac": {"filename": app_config.jac_filename, **app_config.jac_presets},
+    }
+    missing = [
+        f"{section}: {name}"
+        for section, presets in sections.items()
+        for name, value in presets.items()
+        if value is None and name != "pre_calc_age_column"
+    ]
+    if missing:
+        raise ValueError(
+            f"Fill in config.yml before generating data, missing {'; '.join(missing)}"
+        )
+
+
+def _normalized(kind_weights, kind_counts):
+    """each kind's weight split evenly across its programs"""
+    p = kind_weights / kind_counts.values
+    return p / p.sum()
+
+
+def _random_dates(rng, start, end, n, with_time=False):
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    unit = 1 if with_time else 86400
+    span = int((end - start).total_seconds()) // unit
+    offsets = rng.integers(0, span + 1, n) * unit
+    return pd.DatetimeIndex(start + pd.to_timedelta(offsets, unit="s"))
+
+
+def _with_missing(rng, values, n, missing=0.05):
+    """values drawn at random with a share left blank"""
+    out = rng.choice(np.array(values, dtype=object), n)
+    out[rng.random(n) < missing] = None
+    return out
+
+
+def _write_csv(df, fpath):
+    # in chunks so the text for 10M rows is never all held at once
+    for start in range(0, max(len(df), 1), _CSV_CHUNK_ROWS):
+        df.iloc[start : start + _CSV_CHUNK_ROWS].to_csv(
+            fpath,
+            mode="w" if start == 0 else "a",
+            header=start == 0,
+            index=False,
+            date_format=_DATE_FORMAT,
+        )
+
+
+def _write_tlp(df, fpath):
+    """the roster has a note at the top that the tlp skiprows setting skips"""
+    note_row = app_config.tlp_skiprows
+    with pd.ExcelWriter(fpath) as writer:
+        if note_row is None:
+            df.to_excel(writer, index=False)
+            return
+        note = pd.DataFrame({"note": ["generated roster, not real data"]})
+        note.to_excel(writer, index=False, header=False, startrow=note_row)
+        df.to_excel(writer, index=False, startrow=note_row + 1)
+
+
+def synthetic_cli():
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Use to write a month folder of fake data for development"
+    )
+
+    parser.add_argument("root", help="data root to write the month folder under")
+    parser.add_argument("end_date", type=lambda x: pd.Timestamp(x))
+    parser.add_argument("--episodes", type=int, default=100_000)
+    parser.add_argument(
+        "--roster-rows",
+        type=int,
+        default=None,
+        help="rows in the TLP and JAC rosters (default: scales with episodes)",
+    )
+    parser.add_argument("--history-years", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    month_dir = write_month(
+        args.root,
+        args.end_date,
+        args.episodes,
+        roster_rows=args.roster_rows,
+        history_years=args.history_years,
+        seed=args.seed,
+    )
+    print(f"wrote {args.episodes} episodes to {month_dir}")
+
+
+if __name__ == "__main__":
+    synthetic_cli()